@@ -1,6 +1,25 @@
+import time
+from typing import Callable, Optional, Tuple
+
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from src.config import (
+    FUSION_STRATEGY,
+    REALTIME_LATENCY_BUDGET,
+    REALTIME_TARGET_FPS,
+    STREAM_DECODE_THREADS,
+    STREAM_SYNC_MODE,
+    VIDEO_CODECS,
+    VIDEO_WRITER_QUEUE_SIZE,
+)
+from src.dehaze.engine import get_dehaze_engine
+from src.dehaze.temporal import TemporalDehazer
+from src.fusion import FrameFusion
+from src.image_detect import draw_detections, to_detections
+from src.model_registry import model_registry
+from src.realtime import AdaptiveImgsz, LatencyTracker
+from src.stream_sync import StreamSynchronizer
+from src.video_io import AsyncVideoWriter, ThreadedBatchMap, open_video_writer
 
 
 class MultiModalVideoDetector:
@@ -9,162 +28,349 @@ class MultiModalVideoDetector:
         ir_params: dict,
         tr_params: dict,
         model_path: str,
-        output_path: str,
+        output_path: Optional[str] = None,
         conf_thres: float = 0.5,
         show_preview: bool = True,
+        dehaze: bool = False,
+        dehaze_batch_size: int = 4,
+        dehaze_temporal: bool = False,
+        realtime: bool = False,
+        target_fps: float = REALTIME_TARGET_FPS,
+        latency_budget: Optional[float] = REALTIME_LATENCY_BUDGET,
+        fusion: str = FUSION_STRATEGY,
+        fusion_weights=None,
+        sync_mode: str = STREAM_SYNC_MODE,
+        decode_threads: bool = STREAM_DECODE_THREADS,
+        codec: Optional[str] = None,
+        output_fps: Optional[float] = None,
     ):
         # 初始化视频捕获
         self.ir_cap = cv2.VideoCapture(ir_params["video_path"])
         self.tr_cap = cv2.VideoCapture(tr_params["video_path"])
 
-        # 检查视频是否成功打开
-        if not self.ir_cap.isOpened() or not self.tr_cap.isOpened():
-            raise ValueError("无法打开视频文件")
-
-        # 跳转到指定起始帧
-        if "start_frame" in ir_params:
-            self.ir_cap.set(cv2.CAP_PROP_POS_FRAMES, ir_params["start_frame"])
-        if "start_frame" in tr_params:
-            self.tr_cap.set(cv2.CAP_PROP_POS_FRAMES, tr_params["start_frame"])
-
-        # 加载YOLO模型
-        self.model = YOLO(model_path)
-
-        # 设置参数
-        self.ir_params = ir_params
-        self.tr_params = tr_params
-        self.conf_thres = conf_thres
-        self.show_preview = show_preview
-
-        # 创建输出视频写入器
-        self.writer = cv2.VideoWriter(
-            output_path,
-            cv2.VideoWriter.fourcc(*"mp4v"),
-            25,  # 输出帧率
-            ir_params["resolution"],
-        )
+        # 之后任一步初始化失败（如 learned 融合缺少权重文件）时释放已打开的视频
+        try:
+            # 检查视频是否成功打开
+            if not self.ir_cap.isOpened() or not self.tr_cap.isOpened():
+                raise ValueError("无法打开视频文件")
+
+            # 跳转到指定起始帧
+            if "start_frame" in ir_params:
+                self.ir_cap.set(cv2.CAP_PROP_POS_FRAMES, ir_params["start_frame"])
+            if "start_frame" in tr_params:
+                self.tr_cap.set(cv2.CAP_PROP_POS_FRAMES, tr_params["start_frame"])
+
+            # 未指定裁剪区域和分辨率时使用整帧，TR缩放到与IR相同的分辨率
+            ir_size = self._frame_size(self.ir_cap)
+            ir_params = {"crop_params": (0, 0, *ir_size), "resolution": ir_size, **ir_params}
+            tr_params = {
+                "crop_params": (0, 0, *self._frame_size(self.tr_cap)),
+                "resolution": ir_params["resolution"],
+                **tr_params,
+            }
+
+            # 从模型注册表预加载YOLO模型
+            self.model_path = model_path
+            model_registry.get(model_path)
+
+            # 设置参数
+            self.ir_params = ir_params
+            self.tr_params = tr_params
+            self.conf_thres = conf_thres
+            self.show_preview = show_preview
+
+            # 裁剪缩放查找表和融合缓冲区只创建一次，逐帧处理不再分配内存
+            self.fusion = FrameFusion(
+                ir_params, tr_params, strategy=fusion, weights=fusion_weights
+            )
+
+            # 融合帧在检测前去雾，dehaze_temporal 时在相邻帧之间复用全局统计量
+            self.dehaze_engine = None
+            if dehaze:
+                engine = get_dehaze_engine()
+                self.dehaze_engine = TemporalDehazer(engine) if dehaze_temporal else engine
+            self.dehaze_batch_size = dehaze_batch_size
+
+            # 实时模式：gen() 按源帧率跳过过期帧，并自适应调整推理分辨率
+            self.realtime = realtime
+            self.imgsz_controller = AdaptiveImgsz(
+                target_fps=target_fps, latency_budget=latency_budget
+            )
+            self.latency = LatencyTracker()
+
+            # 以IR为主路，按时间戳为每帧IR配对最接近的TR帧；decode_threads 时两路在各自线程中解码，
+            # 解码线程随即启动，因此放在其他可能失败的初始化之后
+            self.sync = StreamSynchronizer(
+                self.ir_cap, self.tr_cap, mode=sync_mode, threaded=decode_threads
+            )
+        except Exception:
+            self.ir_cap.release()
+            self.tr_cap.release()
+            raise
+        self.source_fps = self.sync.primary.fps
+
+        # 输出视频在 run() 时才创建：帧率默认跟随IR源，编码器不可用时按 VIDEO_CODECS 依次回退
+        self.output_path = output_path
+        self.output_fps = output_fps or self.source_fps
+        self.codecs = (codec,) + tuple(c for c in VIDEO_CODECS if c != codec) if codec else VIDEO_CODECS
+        self.codec: Optional[str] = None
+        self.writer: Optional[AsyncVideoWriter] = None
 
         # 初始化帧计数器
         self.frame_count = 0
 
-    def process_frame(self, frame: np.ndarray, params: dict) -> np.ndarray:
-        """处理单帧图像"""
-        if frame is None:
-            return None
-
-        x, y, w, h = map(int, params["crop_params"])
-        frame = frame[y : y + h, x : x + w]
-        return cv2.resize(frame, params["resolution"])
-
-    def detect_and_draw(self, frame: np.ndarray) -> np.ndarray:
-        """使用YOLO进行检测并绘制边界框"""
-        results = self.model(
-            frame,
-            conf=self.conf_thres,
-            classes=[0],
-            verbose=False,
-        )[0]
-        annotated_frame = results.plot()
-        return annotated_frame
-
-    def run(self):
-        """运行多模态视频检测"""
-        while True:
-            self.frame_count += 1
+    @staticmethod
+    def _frame_size(cap: cv2.VideoCapture) -> Tuple[int, int]:
+        return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-            # 每6帧丢弃一帧实现帧率同步
-            if self.frame_count % 6 == 0:
-                if not self.tr_cap.grab():
-                    break
-                continue
+    def _open_writer(self) -> AsyncVideoWriter:
+        """创建输出视频写入器，编码在独立线程中进行"""
+        if not self.output_path:
+            raise ValueError("未指定输出视频路径")
+        writer, self.codec = open_video_writer(
+            self.output_path, self.output_fps, tuple(self.ir_params["resolution"]), self.codecs
+        )
+        return AsyncVideoWriter(writer, queue_size=VIDEO_WRITER_QUEUE_SIZE)
+
+    def detect_and_draw(self, frame: np.ndarray, imgsz: Optional[int] = None) -> np.ndarray:
+        """使用YOLO进行检测，并在输入帧上原地绘制边界框
+
+        Args:
+            frame: 输入帧，会被修改
+            imgsz: 推理输入尺寸，None 时使用模型默认值
+        """
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        with model_registry.acquire(self.model_path) as model:
+            results = model(
+                frame,
+                conf=self.conf_thres,
+                classes=[0],
+                verbose=False,
+                **kwargs,
+            )[0]
+        return draw_detections(frame, to_detections(results))
+
+    def run(
+        self,
+        cancel_check: Optional[Callable[[], None]] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ):
+        """运行多模态视频检测
+
+        Args:
+            cancel_check: 每帧调用一次，任务被取消时应抛出异常以中止处理
+            progress_callback: 每输出一帧调用一次，参数为已输出帧数和预计总帧数
+        """
+        try:
+            self.writer = self._open_writer()
+            self._run_loop(cancel_check, progress_callback)
+        finally:
+            # 清理资源，先停止解码线程再释放视频
+            self.sync.close()
+            self.ir_cap.release()
+            self.tr_cap.release()
+            if self.writer is not None:
+                # 等待写入线程把队列中的帧写完
+                self.writer.release()
+                self.writer = None
+            if self.show_preview:
+                cv2.destroyAllWindows()
+
+    def estimate_total_frames(self) -> int:
+        """估算输出帧数：IR剩余帧数与TR剩余时长中较短的一方决定总帧数"""
+        return self.sync.estimate_pairs()
+
+    def sync_stats(self) -> dict:
+        """IR/TR帧配对统计，包括跳过和复用的TR帧数以及时间戳漂移（毫秒）"""
+        return self.sync.stats()
+
+    def _grab_pair(self) -> bool:
+        """前进一对帧，只抓取不转换为图像，视频结束时返回False"""
+        if not self.sync.grab():
+            return False
+        self.frame_count += 1
+        return True
+
+    def _read_pair(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """读取下一对帧，视频结束时返回None"""
+        if not self._grab_pair():
+            return None
+        return self.sync.retrieve()
 
-            # 获取两路视频帧
-            if not (self.ir_cap.grab() and self.tr_cap.grab()):
-                break
+    def _fuse(self, ir_frame: np.ndarray, tr_frame: np.ndarray) -> np.ndarray:
+        """裁剪缩放两路帧并融合，返回的融合帧在下一次调用时被覆盖"""
+        return self.fusion.fuse(ir_frame, tr_frame)
 
-            ir_ret, ir_frame = self.ir_cap.retrieve()
-            tr_ret, tr_frame = self.tr_cap.retrieve()
+    def _fused_frames(self, copy: bool = False):
+        """按时间戳同步读取两路视频并融合，逐帧产出 (IR原始帧, TR原始帧, 融合帧)
 
-            if not (ir_ret and tr_ret):
+        Args:
+            copy: 融合帧是否复制一份；消费者不在下一帧之前用完融合帧时（如经过队列）需要复制
+        """
+        while True:
+            pair = self._read_pair()
+            if pair is None:
                 break
+            ir_frame, tr_frame = pair
+            fused = self._fuse(ir_frame, tr_frame)
+            yield ir_frame, tr_frame, fused.copy() if copy else fused
 
-            # 处理帧
-            ir_processed = self.process_frame(ir_frame, self.ir_params)
-            tr_processed = self.process_frame(tr_frame, self.tr_params)
-
-            # 显示原始帧
-            if self.show_preview:
-                cv2.imshow("IR Original", ir_frame)
-                cv2.imshow("TR Original", tr_frame)
-
-            # 融合两个模态，使用加权平均
-            fused_frame = cv2.addWeighted(ir_processed, 0.3, tr_processed, 0.7, 0)
-
-            # 目标检测和绘制
-            output_frame = self.detect_and_draw(fused_frame)
-
-            # 写入输出视频
-            self.writer.write(output_frame)
+    def _dehaze_fused(self, items: list) -> list:
+        """对一批融合帧去雾，原始帧保持不变"""
+        dehazed = self.dehaze_engine.dehaze_frames([fused for *_, fused in items])
+        return [(ir, tr, fused) for (ir, tr, _), fused in zip(items, dehazed)]
 
-            # 显示预览
-            if self.show_preview:
-                cv2.imshow("Detection", output_frame)
-                key = cv2.waitKey(1)
-                if key == 32:  # 空格暂停
-                    while True:
-                        if cv2.waitKey(0) == 32:  # 再次按空格继续
-                            break
-                elif key == 27:  # ESC退出
-                    break
-
-                if cv2.waitKey(1) == 27:  # ESC退出
-                    break
-
-        # 清理资源
-        self.ir_cap.release()
-        self.tr_cap.release()
-        self.writer.release()
-        if self.show_preview:
-            cv2.destroyAllWindows()
+    def _run_loop(
+        self,
+        cancel_check: Optional[Callable[[], None]],
+        progress_callback: Optional[Callable[[int, int], None]],
+    ):
+        total_frames = self.estimate_total_frames()
+        frames_done = 0
+        dehazer = None
+        # 去雾阶段在另一线程中预读多帧，融合缓冲区不能直接交给它
+        frames = self._fused_frames(copy=self.dehaze_engine is not None)
+        if self.dehaze_engine is not None:
+            # 去雾在独立线程中按批执行，与检测通过有界队列衔接
+            dehazer = ThreadedBatchMap(
+                frames,
+                self._dehaze_fused,
+                batch_size=self.dehaze_batch_size,
+                name="dehaze-stage",
+            )
+            frames = iter(dehazer)
+
+        try:
+            for ir_frame, tr_frame, fused_frame in frames:
+                if cancel_check is not None:
+                    cancel_check()
+
+                # 显示原始帧
+                if self.show_preview:
+                    cv2.imshow("IR Original", ir_frame)
+                    cv2.imshow("TR Original", tr_frame)
+
+                # 目标检测和绘制
+                output_frame = self.detect_and_draw(fused_frame)
+
+                # 写入输出视频，编码在写入线程中进行；输出帧位于复用的融合缓冲区，需要复制
+                self.writer.write_copy(output_frame)
+                frames_done += 1
+                if progress_callback is not None:
+                    progress_callback(frames_done, max(total_frames, frames_done))
+
+                # 显示预览
+                if self.show_preview:
+                    cv2.imshow("Detection", output_frame)
+                    key = cv2.waitKey(1)
+                    if key == 32:  # 空格暂停
+                        while True:
+                            if cv2.waitKey(0) == 32:  # 再次按空格继续
+                                break
+                    elif key == 27:  # ESC退出
+                        break
+
+                    if cv2.waitKey(1) == 27:  # ESC退出
+                        break
+        finally:
+            if dehazer is not None:
+                dehazer.close()
 
     def gen(self):
-        """生成实时视频流"""
+        """生成实时视频流，生成器关闭时释放视频资源"""
+        try:
+            if self.realtime:
+                yield from self._realtime_loop()
+            else:
+                yield from self._gen_loop()
+        finally:
+            self.sync.close()
+            self.ir_cap.release()
+            self.tr_cap.release()
+
+    def stats(self) -> dict:
+        """输出视频信息和IR/TR帧配对统计"""
+        return {
+            "frames": self.frame_count,
+            "fps": self.output_fps,
+            "codec": self.codec,
+            "sync": self.sync_stats(),
+        }
+
+    def latency_stats(self) -> dict:
+        """实时模式的端到端延迟、跳帧数和当前推理分辨率"""
+        return {
+            **self.latency.stats(),
+            **self.imgsz_controller.stats(),
+            "sync": self.sync_stats(),
+        }
+
+    def _encode_part(self, frame: np.ndarray) -> bytes:
+        """编码为 MJPEG 流的一个分段"""
+        frame_bytes = cv2.imencode(".jpg", frame)[1].tobytes()
+        return b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+
+    def _gen_loop(self):
         while True:
-            self.frame_count += 1
-
-            # 每6帧丢弃一帧实现帧率同步
-            if self.frame_count % 6 == 0:
-                if not self.tr_cap.grab():
-                    break
-                continue
-
-            if not (self.ir_cap.grab() and self.tr_cap.grab()):
+            pair = self._read_pair()
+            if pair is None:
                 break
-
-            ir_ret, ir_frame = self.ir_cap.retrieve()
-            tr_ret, tr_frame = self.tr_cap.retrieve()
+            ir_frame, tr_frame = pair
             # 同时展示两路视频流
-            cv2.imshow("IR", ir_frame)
-            cv2.imshow("TR", tr_frame)
-
-            if not (ir_ret and tr_ret):
-                break
-
-            # 处理帧
-            ir_processed = self.process_frame(ir_frame, self.ir_params)
-            tr_processed = self.process_frame(tr_frame, self.tr_params)
+            if self.show_preview:
+                cv2.imshow("IR", ir_frame)
+                cv2.imshow("TR", tr_frame)
 
-            # 融合两个模态
-            fused_frame = cv2.addWeighted(ir_processed, 0.3, tr_processed, 0.7, 0)
+            fused_frame = self._fuse(ir_frame, tr_frame)
+            if self.dehaze_engine is not None:
+                fused_frame = self.dehaze_engine.dehaze_frames([fused_frame])[0]
 
             # 目标检测和绘制
             output_frame = self.detect_and_draw(fused_frame)
+            yield self._encode_part(output_frame)
 
-            # 转换图像格式用于流传输
-            frame_bytes = cv2.imencode(".jpg", output_frame)[1].tobytes()
-            yield (
-                b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
-            )
+    def _realtime_loop(self):
+        """延迟优先的生成循环
+
+        把视频文件当作按源帧率到达的实时源：每次处理前先跳到当前时刻最新的一对帧，
+        处理期间到达的帧只抓取不解码，延迟不随处理速度不足而累积。
+        延迟从帧按源帧率到达的时刻计到编码完成。
+        """
+        clock_start = time.perf_counter()
+        index = -1
+        while True:
+            # 当前时刻已到达的最新帧序号
+            latest = int((time.perf_counter() - clock_start) * self.source_fps)
+            stale = max(latest - index - 1, 0)
+            for _ in range(stale):
+                if not self._grab_pair():
+                    return
+            if stale:
+                self.latency.skip(stale)
+            index += stale + 1
+
+            # 处理速度快于源帧率时等待下一帧到达
+            arrived_at = clock_start + index / self.source_fps
+            wait = arrived_at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+            pair = self._read_pair()
+            if pair is None:
+                return
+            ir_frame, tr_frame = pair
+
+            mark = time.perf_counter()
+            fused_frame = self._fuse(ir_frame, tr_frame)
+            if self.dehaze_engine is not None:
+                fused_frame = self.dehaze_engine.dehaze_frames([fused_frame])[0]
+            output_frame = self.detect_and_draw(fused_frame, self.imgsz_controller.imgsz)
+            part = self._encode_part(output_frame)
+
+            now = time.perf_counter()
+            self.imgsz_controller.update(now - mark)
+            self.latency.record(now - arrived_at)
+            yield part
 
 
 def main():
@@ -18,10 +18,84 @@ MERGE_FOLDER = join(UPLOAD_FOLDER, "merged")
 YOLO_FOLDER = join(UPLOAD_FOLDER, "yolo")  # yolo模型文件夹
 DATASET_FOLDER = join(UPLOAD_FOLDER, "dataset")  # 数据集文件夹
 VAL_FOLDER = join(UPLOAD_FOLDER, "val")  # 验证集文件夹
+RESULT_CACHE_FOLDER = join(UPLOAD_FOLDER, "cache")  # 推理结果缓存文件夹
 
 # 默认模型路径
 DEFAULT_MODEL_PATH = join(MODEL_FOLDER, "yolo11n.pt")
 
+# 模型缓存的内存上限（按权重大小估算，单位字节），超出后按LRU淘汰
+MODEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 推理结果缓存：内存层和磁盘层的容量上限（字节）
+RESULT_CACHE_MEMORY_BYTES = 128 * 1024 * 1024
+RESULT_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+# 图像检测微批处理参数：单批最大图片数和凑批最长等待时间（毫秒）
+DETECT_BATCH_MAX_SIZE = 8
+DETECT_BATCH_MAX_WAIT_MS = 10
+
+# 视频检测每次推理的最大帧数，解码和去雾队列的长度随批大小增长
+DETECT_VIDEO_MAX_BATCH = 32
+
+# 视频检测 stride 的上限，以及等待写出的帧数上限（超出时强制当前帧为关键帧并写出，限制内存）
+DETECT_VIDEO_MAX_STRIDE = 120
+DETECT_VIDEO_MAX_PENDING = 64
+
+# 任务存储：SQLite数据库路径，以及已结束任务的保留时间（秒）
+TASK_DB_PATH = join(UPLOAD_FOLDER, "tasks.db")
+TASK_TTL_SECONDS = 7 * 24 * 3600
+
+# 后台任务调度：工作线程数，以及排队任务数上限（超出时返回429）
+SCHEDULER_WORKERS = 2
+SCHEDULER_MAX_QUEUE = 32
+
+# 去雾分块推理：宽或高超过 DEHAZE_TILE_SIZE 的图像分块处理以限制内存，相邻分块重叠 DEHAZE_TILE_OVERLAP 像素
+DEHAZE_TILE_SIZE = 1024
+DEHAZE_TILE_OVERLAP = 32
+
+# 去雾推理后端："eager"、"torchscript"、"onnx" 或 "auto"（加载时对已导出的模型和 eager 测速，
+# 只在导出模型更快时使用，见 src/dehaze/export.py）
+DEHAZE_RUNTIME = "auto"
+
+# 视频去雾时域缓存：每隔多少帧或帧间缩略图差异（0-255）超过阈值时重新计算全局统计量，
+# 以及每隔多少个复用帧做一次完整推理来统计误差（0为不统计）
+DEHAZE_TEMPORAL_REFRESH_INTERVAL = 15
+DEHAZE_TEMPORAL_DIFF_THRESHOLD = 4.0
+DEHAZE_TEMPORAL_DRIFT_INTERVAL = 30
+
+# 实时视频流：共享环形缓冲区的容量（帧），以及无观看者多长时间后停止推理（秒）
+STREAM_RING_SIZE = 8
+STREAM_IDLE_TIMEOUT = 10.0
+
+# 实时模式：始终处理最新的一对帧并跳过过期帧，按目标帧率（或每帧延迟预算，秒，设置后优先）
+# 在候选输入尺寸之间自动调整YOLO推理分辨率
+REALTIME_TARGET_FPS = 15.0
+REALTIME_LATENCY_BUDGET = None
+REALTIME_IMGSZ_CHOICES = (320, 416, 512, 640)
+
+# IR/TR帧同步：按容器时间戳（"timestamp"，不可用时自动改用帧率）或声明帧率（"fps"）配对最接近的帧
+STREAM_SYNC_MODE = "timestamp"
+
+# IR/TR两路视频是否各在独立线程中解码，以及每路的解码队列长度（帧）
+STREAM_DECODE_THREADS = True
+STREAM_DECODE_QUEUE_SIZE = 4
+
+# 多模态检测输出视频的编码器，按顺序尝试直到能打开为止；以及写入线程的队列长度（帧）
+VIDEO_CODECS = ("avc1", "mp4v")
+VIDEO_WRITER_QUEUE_SIZE = 8
+
+# IR/TR融合策略："weighted"（加权平均）、"channel"（逐通道权重）、"max"（逐像素取大）
+# 或 "learned"（从 FUSION_LEARNED_PATH 加载的1x1卷积权重）
+FUSION_STRATEGY = "weighted"
+FUSION_LEARNED_PATH = join(MODEL_FOLDER, "fusion_1x1.npz")
+
+# 视频检测逐帧结果的输出格式："jsonl"、"columnar"（定长二进制记录），None 不输出
+DETECTIONS_FORMAT = "jsonl"
+
+# 检测任务的执行后端："thread" 在Flask进程内执行，"process" 在常驻模型的子进程池中执行
+EXECUTION_BACKEND = "thread"
+PROCESS_POOL_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
 # 确保文件夹存在
 for folder in [
     IMAGE_FOLDER,
@@ -33,6 +107,7 @@ for folder in [
     DATASET_FOLDER,
     MODEL_FOLDER,
     VAL_FOLDER,
+    RESULT_CACHE_FOLDER,
 ]:
     if not exists(folder):
         os.makedirs(folder)
@@ -1,41 +1,107 @@
 from __future__ import annotations
 
+import io
 import torch
-import torchvision
-import torch.optim
-import time
-import model as net
+import os
 import numpy as np
 from PIL import Image
 import glob
 from pathlib import Path
+from typing import Union
 
+import src.dehaze.model as net
+from src.dehaze.engine import DehazeEngine
+from src.result_cache import content_digest, make_key, result_cache
 
-def dehaze_image(image_path: str, dehaze_net: torch.nn.Module, save_path: str) -> tuple[str, float]:
+
+def load_image(image_path: str) -> np.ndarray:
+    """读取图片为 HWC uint8 RGB 数组"""
+    with Image.open(image_path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def _encode(image: np.ndarray, filename: str) -> bytes:
+    """按文件扩展名将 RGB 数组编码为图像文件字节"""
+    fmt = Image.registered_extensions().get(Path(filename).suffix.lower(), "PNG")
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def dehaze_image(
+    image_path: str, dehaze_net: Union[torch.nn.Module, DehazeEngine], save_path: str
+) -> tuple[str, float]:
     """检测图片
 
     Args:
         image_path (str): 图片路径
-        dehaze_net (torch.nn.Module): 去雾模型
+        dehaze_net (torch.nn.Module | DehazeEngine): 去雾模型或推理引擎
         save_path (str): 保存路径
 
     Returns:
+        str: 保存的文件名
         float: 检测耗时
     """
-    data_hazy = Image.open(image_path)
-    start = time.time()
-    data_hazy = np.asarray(data_hazy) / 255.0
+    filenames, stats = dehaze_images([image_path], dehaze_net, save_path)
+    return filenames[0], stats["latency_ms"] / 1000
+
+
+def dehaze_images(
+    image_paths: list[str],
+    dehaze_net: Union[torch.nn.Module, DehazeEngine],
+    save_path: str,
+) -> tuple[list[str], dict]:
+    """批量去雾，相同尺寸的图片合并为一个批次推理
+
+    Args:
+        image_paths (list[str]): 图片路径列表
+        dehaze_net (torch.nn.Module | DehazeEngine): 去雾模型或推理引擎
+        save_path (str): 保存路径
+
+    Returns:
+        list[str]: 与输入顺序一致的保存文件名
+        dict: 统计信息，包含总推理耗时、各批次的耗时与内存和命中缓存的图片数
+    """
+    engine = dehaze_net if isinstance(dehaze_net, DehazeEngine) else DehazeEngine(dehaze_net)
+    filenames = [os.path.basename(image_path) for image_path in image_paths]
+
+    # 命中结果缓存的图片直接写出缓存结果，其余图片解码后推理
+    keys: dict[int, str] = {}
+    images: dict[int, np.ndarray] = {}
+    cached = 0
+    for index, image_path in enumerate(image_paths):
+        with open(image_path, "rb") as f:
+            data = f.read()
+        if engine.model_digest:
+            keys[index] = make_key(content_digest(data), engine.model_digest, engine.runtime)
+            hit = result_cache.get(keys[index])
+            if hit is not None:
+                (Path(save_path) / filenames[index]).write_bytes(hit[0])
+                cached += 1
+                continue
+        with Image.open(io.BytesIO(data)) as image:
+            images[index] = np.asarray(image.convert("RGB"))
+
+    # 按尺寸分组
+    groups: dict[tuple, list[int]] = {}
+    for index, image in images.items():
+        groups.setdefault(image.shape, []).append(index)
 
-    data_hazy = torch.from_numpy(data_hazy).float()
-    data_hazy = data_hazy.permute(2, 0, 1)
-    dev = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    data_hazy = data_hazy.to(dev).unsqueeze(0)
+    batches = []
+    for indices in groups.values():
+        outputs, stats = engine.dehaze([images[i] for i in indices])
+        batches.append(stats)
+        for i, output in zip(indices, outputs):
+            data = _encode(output, filenames[i])
+            (Path(save_path) / filenames[i]).write_bytes(data)
+            if i in keys:
+                result_cache.put(keys[i], data)
 
-    clean_image = dehaze_net(data_hazy)
-    end = time.time()
-    filename = image_path.split("\\")[-1]
-    torchvision.utils.save_image(clean_image, Path(save_path) / filename)
-    return filename, (end - start)
+    return filenames, {
+        "latency_ms": sum(stats["latency_ms"] for stats in batches),
+        "batches": batches,
+        "cached": cached,
+    }
 
 
 if __name__ == "__main__":
@@ -43,9 +109,10 @@ if __name__ == "__main__":
         test_list = glob.glob(r"data\ir_align.png")
         dehaze_net = net.dehaze_net().cuda()
         dehaze_net.load_state_dict(torch.load(r"model\dehazer.pth"))
+        engine = DehazeEngine(dehaze_net)
         all_time = 0
         for image in test_list:
-            use_time = dehaze_image(image, dehaze_net, "./results")
+            _, use_time = dehaze_image(image, engine, "./results")
             print(f"{image} 完成!  耗时：{use_time}秒")
             all_time += use_time if use_time < 0.1 else 0
         print("平均耗时: ", all_time / len(test_list))
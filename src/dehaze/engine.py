@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+
+import src.dehaze.model as net
+from src.config import DEHAZE_RUNTIME, DEHAZE_TILE_OVERLAP, DEHAZE_TILE_SIZE, MODEL_FOLDER
+from src.dehaze.export import select_runtime
+from src.dehaze.tiled import TiledDehazer
+from src.result_cache import file_digest
+
+
+def _rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（字节），读取 /proc/self/statm，不支持的平台返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class DehazeEngine:
+    """去雾推理引擎
+
+    在 inference_mode 下执行推理，uint8 图像一步转换为 float32 张量，
+    支持将多张相同尺寸的图像合并为一个批次，并统计每次调用的耗时和内存。
+    设置 tile_size 后，超过该尺寸的图像逐张分块推理。
+    runner 为导出后的推理后端（TorchScript/ONNX），为None时直接调用 eager 模型。
+    """
+
+    def __init__(
+        self,
+        dehaze_net: torch.nn.Module,
+        device: Optional[torch.device] = None,
+        tile_size: Optional[int] = None,
+        tile_overlap: int = 32,
+        runner=None,
+    ):
+        self.device = device or next(dehaze_net.parameters()).device
+        self.dehaze_net = dehaze_net.to(self.device).eval()
+        self.runner = runner or self.dehaze_net
+        self.runtime = getattr(runner, "name", "eager")
+        # 权重文件的哈希，用作结果缓存键的一部分；为None时不缓存
+        self.model_digest: Optional[str] = None
+        # 分块推理依赖网络的分阶段接口，其他网络始终整图推理
+        self.tiler = (
+            TiledDehazer(self.dehaze_net, tile_size, tile_overlap)
+            if tile_size and hasattr(self.dehaze_net, "body")
+            else None
+        )
+
+    def to_tensor(self, images: list[np.ndarray]) -> torch.Tensor:
+        """将 HWC uint8 RGB 图像列表转换为 NCHW float32 张量，取值 [0, 1]"""
+        batch = torch.from_numpy(np.stack(images)).to(self.device)
+        return batch.permute(0, 3, 1, 2).float().div_(255.0)
+
+    @staticmethod
+    def to_images(batch: torch.Tensor) -> list[np.ndarray]:
+        """将 NCHW float 张量转换为 HWC uint8 RGB 图像列表"""
+        batch = batch.mul(255.0).add_(0.5).clamp_(0, 255).to(torch.uint8)
+        return list(batch.permute(0, 2, 3, 1).contiguous().cpu().numpy())
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """对 NCHW float32 张量去雾，超过分块尺寸时逐张分块推理"""
+        with torch.inference_mode():
+            if self.tiler is not None and self.tiler.needs_tiling(*batch.shape[2:]):
+                # 大图逐张分块，避免整批张量占用过多内存
+                return torch.cat([self.tiler(image[None]) for image in batch])
+            return self.runner(batch)
+
+    def dehaze_frames(self, frames: list[np.ndarray]) -> list[np.ndarray]:
+        """对一批相同尺寸的 BGR 视频帧去雾，返回 BGR 帧
+
+        颜色通道在张量上翻转，帧数据不经过编码或落盘。
+        """
+        with torch.inference_mode():
+            batch = self.to_tensor(frames).flip(1)
+            return self.to_images(self.forward(batch).flip(1))
+
+    def dehaze(self, images: list[np.ndarray]) -> tuple[list[np.ndarray], dict]:
+        """对一批相同尺寸的图像去雾
+
+        Args:
+            images (list[np.ndarray]): HWC uint8 RGB 图像列表，尺寸必须一致
+
+        Raises:
+            ValueError: 图像尺寸不一致
+
+        Returns:
+            list[np.ndarray]: 去雾后的 HWC uint8 RGB 图像
+            dict: 本次调用的统计信息（耗时、张量内存、GPU上本次调用的峰值显存、
+                调用前后常驻内存的变化）
+        """
+        if len({image.shape for image in images}) != 1:
+            raise ValueError("批处理的图像尺寸必须一致")
+
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        height, width = images[0].shape[:2]
+        tiled = self.tiler is not None and self.tiler.needs_tiling(height, width)
+        with torch.inference_mode():
+            data_hazy = self.to_tensor(images)
+            clean_image = self.forward(data_hazy)
+            outputs = self.to_images(clean_image)
+        latency = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        stats = {
+            "batch_size": len(images),
+            "tiled": tiled,
+            "runtime": "eager" if tiled else self.runtime,
+            "latency_ms": latency * 1000,
+            "tensor_bytes": data_hazy.element_size() * data_hazy.nelement() * 2,
+            # 峰值统计在调用开始时已重置，只反映本次调用；CPU上没有逐次调用的峰值
+            "peak_memory_bytes": (
+                torch.cuda.max_memory_allocated(self.device)
+                if self.device.type == "cuda"
+                else None
+            ),
+            "rss_delta_bytes": (
+                rss_after - rss_before
+                if rss_before is not None and rss_after is not None
+                else None
+            ),
+        }
+        return outputs, stats
+
+
+_default_engine: Optional[DehazeEngine] = None
+_default_lock = threading.Lock()
+
+
+def get_dehaze_engine() -> DehazeEngine:
+    """进程内共享的去雾引擎，首次调用时加载 dehaze.pth
+
+    图像接口和视频任务共用同一份权重；进程池后端下每个子进程各自加载一次。
+    """
+    global _default_engine
+    with _default_lock:
+        if _default_engine is None:
+            dev = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+            weights_path = Path(MODEL_FOLDER) / "dehaze.pth"
+            dehaze_net = net.dehaze_net().to(dev)
+            dehaze_net.load_state_dict(
+                torch.load(weights_path, map_location=dev, weights_only=True)
+            )
+            dehaze_net.eval()
+            _default_engine = DehazeEngine(
+                dehaze_net,
+                dev,
+                tile_size=DEHAZE_TILE_SIZE,
+                tile_overlap=DEHAZE_TILE_OVERLAP,
+                runner=select_runtime(dehaze_net, DEHAZE_RUNTIME, dev),
+            )
+            _default_engine.model_digest = file_digest(str(weights_path))
+        return _default_engine
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+
+import src.dehaze.model as net
+from src.config import MODEL_FOLDER, get_logger
+
+try:
+    import onnxruntime
+except ImportError:  # 未安装时使用 PyTorch 推理
+    onnxruntime = None
+
+
+logger = get_logger()
+
+WEIGHTS_PATH = Path(MODEL_FOLDER) / "dehaze.pth"
+TORCHSCRIPT_PATH = Path(MODEL_FOLDER) / "dehaze.ts"
+ONNX_PATH = Path(MODEL_FOLDER) / "dehaze.onnx"
+
+# 导出模型与 eager 结果之间允许的最大绝对误差
+PARITY_TOLERANCE = 1e-3
+
+# auto 选择后端时的测速参数：输入尺寸（ONNX 使用导出时的尺寸）和重复次数
+AUTO_BENCHMARK_SIZE = (720, 1280)
+AUTO_BENCHMARK_REPEATS = 3
+
+
+class ExportableDehazeNet(torch.nn.Module):
+    """用于导出的 dehaze_net
+
+    PSA 使用原始的上采样实现：优化实现的分段下标依赖输入数据，追踪后会被固化为常量。
+    """
+
+    def __init__(self, model: net.dehaze_net):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        model = self.model
+        x1, x2 = model.head(x)
+        mean1, std1 = model.pono_ms.stats(x1)
+        mean2, std2 = model.pono_ms.stats(x2)
+        x5, x6 = model.body(x1, x2, (mean1, std1, mean2, std2))
+        return model.tail(x, x5, x6, model.psa.forward_reference(x6))
+
+
+def load_dehaze_net(
+    weights_path: Path = WEIGHTS_PATH, device: Optional[torch.device] = None
+) -> net.dehaze_net:
+    model = net.dehaze_net().to(device or "cpu")
+    model.load_state_dict(torch.load(weights_path, map_location=device or "cpu", weights_only=True))
+    return model.eval()
+
+
+def export_torchscript(
+    model: net.dehaze_net, path: Path = TORCHSCRIPT_PATH, height: int = 720, width: int = 1280
+) -> Path:
+    """追踪导出 TorchScript 模型，输入尺寸不固定"""
+    example = torch.rand(1, 3, height, width, device=next(model.parameters()).device)
+    with torch.no_grad():
+        traced = torch.jit.trace(ExportableDehazeNet(model).eval(), example)
+        traced = torch.jit.freeze(traced)
+    traced.save(str(path))
+    return path
+
+
+def export_onnx(
+    model: net.dehaze_net, path: Path = ONNX_PATH, height: int = 720, width: int = 1280
+) -> Path:
+    """导出 ONNX 模型
+
+    ONNX 的 adaptive_avg_pool2d 只能转换为固定核大小的池化，因此模型只接受导出时的
+    分辨率（宽高需为8的倍数），批大小可变。
+
+    Raises:
+        ValueError: 宽高不是8的倍数
+    """
+    if height % 8 or width % 8:
+        raise ValueError("导出 ONNX 时宽高必须是8的倍数")
+    example = torch.rand(1, 3, height, width, device=next(model.parameters()).device)
+    with torch.no_grad():
+        torch.onnx.export(
+            ExportableDehazeNet(model).eval(),
+            example,
+            str(path),
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            opset_version=17,
+        )
+    return path
+
+
+class OnnxRunner:
+    """onnxruntime CPU 推理，输入尺寸与导出尺寸不一致时回退到 fallback"""
+
+    name = "onnx"
+
+    def __init__(self, path: Path, fallback: torch.nn.Module):
+        self.session = onnxruntime.InferenceSession(
+            str(path), providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_size = tuple(self.session.get_inputs()[0].shape[2:])
+        self.fallback = fallback
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        if tuple(batch.shape[2:]) != self.input_size:
+            return self.fallback(batch)
+        data = np.ascontiguousarray(batch.cpu().numpy())
+        (output,) = self.session.run(None, {self.input_name: data})
+        return torch.from_numpy(output).to(batch.device)
+
+
+class TorchScriptRunner:
+    name = "torchscript"
+
+    def __init__(self, path: Path, device: torch.device):
+        self.module = torch.jit.load(str(path), map_location=device).eval()
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.module(batch)
+
+
+def _load_runner(name: str, model: net.dehaze_net, device: torch.device):
+    """加载已导出的模型，文件不存在或缺少依赖时返回None"""
+    if name == "onnx" and onnxruntime is not None and ONNX_PATH.exists():
+        return OnnxRunner(ONNX_PATH, model)
+    if name == "torchscript" and TORCHSCRIPT_PATH.exists():
+        return TorchScriptRunner(TORCHSCRIPT_PATH, device)
+    return None
+
+
+def _select_fastest(model: net.dehaze_net, device: torch.device):
+    """测速后返回比 eager 更快的已导出模型，都不更快时返回None
+
+    导出的模型使用原始的全分辨率 PSA，不一定比使用优化 PSA 的 eager 推理快。
+    """
+    best, best_ratio = None, 1.0
+    for name in ["onnx", "torchscript"] if device.type == "cpu" else ["torchscript"]:
+        try:
+            runner = _load_runner(name, model, device)
+            if runner is None:
+                continue
+            height, width = getattr(runner, "input_size", None) or AUTO_BENCHMARK_SIZE
+            latency = benchmark(
+                model, height, width, AUTO_BENCHMARK_REPEATS, runners={"eager": model, name: runner}
+            )
+        except Exception as e:
+            logger.warning(f"加载 {name} 去雾模型失败: {str(e)}")
+            continue
+        logger.info(
+            f"去雾后端测速 {height}x{width}: {name} {latency[name]:.1f} ms, "
+            f"eager {latency['eager']:.1f} ms"
+        )
+        ratio = latency[name] / latency["eager"]
+        if ratio < best_ratio:
+            best, best_ratio = runner, ratio
+    return best
+
+
+def select_runtime(model: net.dehaze_net, runtime: str = "auto", device: Optional[torch.device] = None):
+    """选择去雾推理后端
+
+    Args:
+        model (net.dehaze_net): 已加载权重的 eager 模型，也用作回退
+        runtime (str): "eager"、"torchscript"、"onnx" 或 "auto"。auto 对已导出的模型
+            （CPU 上为 onnx 和 torchscript）与 eager 测速，只在更快时使用
+        device (torch.device): 推理设备
+
+    Returns:
+        可调用对象，输入输出均为 NCHW float32 张量；eager 时返回 None
+    """
+    device = device or next(model.parameters()).device
+    if runtime == "auto":
+        return _select_fastest(model, device)
+    if runtime in ("onnx", "torchscript"):
+        try:
+            runner = _load_runner(runtime, model, device)
+            if runner is not None:
+                return runner
+        except Exception as e:
+            logger.warning(f"加载 {runtime} 去雾模型失败，使用 eager 推理: {str(e)}")
+    elif runtime != "eager":
+        logger.warning(f"未知的去雾推理后端: {runtime}")
+    return None
+
+
+def _runners(model: net.dehaze_net) -> dict:
+    runners = {"eager": model}
+    device = next(model.parameters()).device
+    for name in ("torchscript", "onnx"):
+        runner = _load_runner(name, model, device)
+        if runner is not None:
+            runners[name] = runner
+    return runners
+
+
+def check_parity(
+    model: net.dehaze_net,
+    height: int = 720,
+    width: int = 1280,
+    tolerance: float = PARITY_TOLERANCE,
+) -> dict:
+    """与 eager 结果比较，返回各后端的最大绝对误差
+
+    Raises:
+        AssertionError: 任一后端的误差超过 tolerance
+    """
+    runners = _runners(model)
+    batch = torch.rand(1, 3, height, width, device=next(model.parameters()).device)
+    with torch.inference_mode():
+        expected = model(batch)
+        diffs = {
+            name: (runner(batch) - expected).abs().max().item()
+            for name, runner in runners.items()
+        }
+    failed = {name: diff for name, diff in diffs.items() if not diff <= tolerance}
+    if failed:
+        raise AssertionError(
+            "导出模型与 eager 结果不一致（容差 {:.0e}）: {}".format(
+                tolerance, ", ".join(f"{name} {diff:.2e}" for name, diff in failed.items())
+            )
+        )
+    return diffs
+
+
+def benchmark(
+    model: net.dehaze_net,
+    height: int = 720,
+    width: int = 1280,
+    repeats: int = 20,
+    runners: Optional[dict] = None,
+) -> dict:
+    """各后端的平均单次推理耗时（毫秒），runners 为None时测试所有已导出的模型"""
+    runners = runners if runners is not None else _runners(model)
+    device = next(model.parameters()).device
+    batch = torch.rand(1, 3, height, width, device=device)
+    latency = {}
+    with torch.inference_mode():
+        for name, runner in runners.items():
+            runner(batch)  # 预热
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                runner(batch)
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            latency[name] = (time.perf_counter() - start) * 1000 / repeats
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出去雾模型并比较各推理后端")
+    parser.add_argument("--format", choices=["torchscript", "onnx", "all", "none"], default="all")
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    dehaze_model = load_dehaze_net()
+    if args.format in ("torchscript", "all"):
+        print(f"TorchScript: {export_torchscript(dehaze_model, height=args.height, width=args.width)}")
+    if args.format in ("onnx", "all"):
+        print(f"ONNX: {export_onnx(dehaze_model, height=args.height, width=args.width)}")
+
+    for name, diff in check_parity(dehaze_model, args.height, args.width).items():
+        print(f"{name:12s} max abs diff {diff:.2e}")
+    for name, ms in benchmark(dehaze_model, args.height, args.width, args.repeats).items():
+        print(f"{name:12s} {ms:8.2f} ms")
@@ -1,7 +1,14 @@
+import os
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from src.config import MODEL_FOLDER
+
+# 优化后的 PSA 与原始实现之间允许的最大绝对误差
+PSA_PARITY_TOLERANCE = 1e-4
+
 
 class PositionalNormalizationMS(nn.Module):
     """
@@ -13,11 +20,39 @@ class PositionalNormalizationMS(nn.Module):
         self.epsilon = epsilon
 
     def forward(self, x):
-        mean = x.mean(dim=[2, 3], keepdim=True)  # 计算均值
-        std = x.std(dim=[2, 3], keepdim=True)  # 计算标准差
+        mean, std = self.stats(x)
         normalized = (x - mean) / (std + self.epsilon)  # 归一化
         return normalized, mean, std
 
+    @staticmethod
+    def stats(x):
+        mean = x.mean(dim=[2, 3], keepdim=True)  # 计算均值
+        std = x.std(dim=[2, 3], keepdim=True)  # 计算标准差
+        return mean, std
+
+
+def nearest_index(in_size, out_size, device=None):
+    """返回最近邻插值时每个输出位置对应的输入下标，与 F.interpolate 的取整方式一致"""
+    index = torch.arange(in_size, dtype=torch.float32, device=device).view(1, 1, in_size)
+    return F.interpolate(index, size=out_size, mode="nearest").view(-1).long()
+
+
+def segment_index(index_maps):
+    """将若干条下标映射按取值组合切分为连续的段
+
+    Args:
+        index_maps: 长度相同的一维下标张量列表
+
+    Returns:
+        list: 每条映射在各段上的取值
+        Tensor: 各段的长度
+    """
+    stacked = torch.stack(index_maps)
+    change = (stacked[:, 1:] != stacked[:, :-1]).any(dim=0)
+    starts = torch.cat((change.new_ones(1), change)).nonzero().view(-1)
+    bounds = torch.cat((starts, starts.new_tensor([stacked.shape[1]])))
+    return list(stacked[:, starts]), bounds.diff()
+
 
 class PyramidSqueezeAttention(nn.Module):
     """
@@ -34,21 +69,54 @@ class PyramidSqueezeAttention(nn.Module):
         )
         self.softmax = nn.Softmax(dim=1)
 
-    def forward(self, x):
-        branches = [
-            F.adaptive_avg_pool2d(x, output_size=(1, 1)),
-            F.adaptive_avg_pool2d(x, output_size=(2, 2)),
-            F.adaptive_avg_pool2d(x, output_size=(4, 4)),
-            F.adaptive_avg_pool2d(x, output_size=(8, 8)),
-        ]
+    pool_sizes = (1, 2, 4, 8)
+
+    def pool(self, x):
+        """计算金字塔各尺度的全局池化结果"""
+        return [F.adaptive_avg_pool2d(x, output_size=(n, n)) for n in self.pool_sizes]
+
+    def attention(self, grid):
+        attention = self.conv1(grid)
+        attention = self.conv2(attention)
+        return self.softmax(attention)
+
+    def forward(self, x, pools=None, full_size=None, offset=(0, 0)):
+        """
+        1x1 卷积和 softmax 都是逐像素运算，最近邻上采样后每个像素的输入只取决于
+        它落在各尺度的哪个池化格子里。因此只在这些格子组合构成的小网格上计算注意力
+        （不超过 15x15），再按行列展开到原分辨率，不生成4个全分辨率分支及其拼接结果。
+
+        Args:
+            x: 输入特征
+            pools: 预先在整幅图像上计算的池化结果，为None时在x上计算
+            full_size: 整幅图像的 (H, W)，x 为其中一块时使用
+            offset: x 在整幅图像中的左上角坐标 (y, x)
+        """
+        if pools is None:
+            pools = self.pool(x)
+        full_h, full_w = full_size or x.shape[2:]
+        (y0, x0), (h, w) = offset, x.shape[2:]
+        rows, row_lengths = segment_index(
+            [nearest_index(b.shape[2], full_h, x.device)[y0 : y0 + h] for b in pools]
+        )
+        cols, col_lengths = segment_index(
+            [nearest_index(b.shape[3], full_w, x.device)[x0 : x0 + w] for b in pools]
+        )
+        grid = torch.cat(
+            [b[:, :, iy][:, :, :, ix] for b, iy, ix in zip(pools, rows, cols)], dim=1
+        )
+        attention = self.attention(grid)
+        attention = attention.repeat_interleave(row_lengths, dim=2, output_size=h)
+        attention = attention.repeat_interleave(col_lengths, dim=3, output_size=w)
+        return x * attention
+
+    def forward_reference(self, x):
+        """原始实现：各分支上采样到原分辨率后拼接，用于一致性校验和模型导出"""
         branches = [
-            F.interpolate(b, size=x.shape[2:], mode="nearest") for b in branches
+            F.interpolate(b, size=x.shape[2:], mode="nearest") for b in self.pool(x)
         ]
         concat = torch.cat(branches, dim=1)
-        attention = self.conv1(concat)
-        attention = self.conv2(attention)
-        attention = self.softmax(attention)
-        return x * attention
+        return x * self.attention(concat)
 
 
 class dehaze_net(nn.Module):
@@ -71,13 +139,19 @@ class dehaze_net(nn.Module):
 
         self.psa = PyramidSqueezeAttention(in_channels=16)
 
-    def forward(self, x):
-        # Feature extraction with PONO-MS
+    def head(self, x):
+        """浅层特征，PONO-MS 的统计量在这两层输出上计算"""
         x1 = self.relu(self.e_conv1(x))
-        x1_pm, mean1, std1 = self.pono_ms(x1)  # PONO-MS
-
         x2 = self.relu(self.e_conv2(x1))
-        x2_pm, mean2, std2 = self.pono_ms(x2)  # PONO-MS
+        return x1, x2
+
+    def body(self, x1, x2, stats):
+        """
+        Args:
+            x1, x2: head 的输出
+            stats: PONO-MS 统计量 (mean1, std1, mean2, std2)
+        """
+        mean1, std1, mean2, std2 = stats
 
         concat1 = torch.cat((x1, x2), 1)
         x3 = self.relu(self.e_conv3(concat1))
@@ -97,9 +171,9 @@ class dehaze_net(nn.Module):
 
         # Additional feature extraction
         x6 = self.relu(self.e_conv6(x5))
+        return x5, x6
 
-        psa = self.psa(x6)
-
+    def tail(self, x, x5, x6, psa):
         x7 = self.relu(self.e_conv7(psa))
         x8 = self.relu(self.e_conv8(x7))
 
@@ -115,9 +189,77 @@ class dehaze_net(nn.Module):
 
         return clean_image
 
+    def forward(self, x):
+        # Feature extraction with PONO-MS
+        x1, x2 = self.head(x)
+        mean1, std1 = self.pono_ms.stats(x1)  # PONO-MS
+        mean2, std2 = self.pono_ms.stats(x2)  # PONO-MS
+
+        x5, x6 = self.body(x1, x2, (mean1, std1, mean2, std2))
+
+        psa = self.psa(x6)
+
+        return self.tail(x, x5, x6, psa)
+
+
+def check_psa_parity(
+    height=720, width=1280, device="cpu", weights_path=None, tolerance=PSA_PARITY_TOLERANCE
+):
+    """在发布的 dehaze.pth 权重上比较优化后的 PSA 与原始实现
+
+    以 strict=True 加载权重，确认拆分出 head/body/tail 后参数名没有变化；
+    分别比较 PSA 的输出和整个网络的输出。
+
+    Args:
+        height, width: 随机输入图像的尺寸
+        device: 推理设备
+        weights_path: 权重路径，为None时使用 MODEL_FOLDER/dehaze.pth
+        tolerance: 允许的最大绝对误差
+
+    Returns:
+        dict: {"psa": PSA 输出的最大绝对误差, "output": 网络输出的最大绝对误差}
+
+    Raises:
+        AssertionError: 任一误差超过 tolerance
+    """
+    weights_path = weights_path or os.path.join(MODEL_FOLDER, "dehaze.pth")
+    model = dehaze_net().to(device)
+    model.load_state_dict(
+        torch.load(weights_path, map_location=device, weights_only=True), strict=True
+    )
+    model.eval()
+
+    x = torch.rand(1, 3, height, width, device=device)
+    with torch.inference_mode():
+        x1, x2 = model.head(x)
+        stats = (*model.pono_ms.stats(x1), *model.pono_ms.stats(x2))
+        x5, x6 = model.body(x1, x2, stats)
+        expected_psa = model.psa.forward_reference(x6)
+        expected = model.tail(x, x5, x6, expected_psa)
+        actual_psa = model.psa(x6)
+        actual = model(x)
+
+    diffs = {
+        "psa": (expected_psa - actual_psa).abs().max().item(),
+        "output": (expected - actual).abs().max().item(),
+    }
+    for name, diff in diffs.items():
+        if not diff <= tolerance:
+            raise AssertionError(
+                f"PSA 一致性校验失败（{name}）：最大绝对误差 {diff:.2e} 超过 {tolerance:.0e}"
+            )
+    return diffs
+
 
 # 测试样例
 if __name__ == "__main__":
+    for size in [(64, 64), (270, 481), (720, 1280)]:
+        diffs = check_psa_parity(*size)
+        print(
+            f"PSA parity {size}: psa max abs diff {diffs['psa']:.2e}, "
+            f"output max abs diff {diffs['output']:.2e}"
+        )
+
     model = dehaze_net()
     print(model)
 
@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from src.dehaze.model import nearest_index, segment_index
+
 
 class PositionalNormalization(nn.Module):
     """
@@ -31,13 +33,36 @@ class PyramidSqueezeAttention(nn.Module):
         self.softmax = nn.Softmax(dim=1)
         self.sigmoid = nn.Sigmoid()
 
+    pool_sizes = (1, 2, 4, 8)
+
+    def attention(self, grid):
+        attention = self.conv1(grid)
+        attention = self.conv2(attention)
+        return self.sigmoid(attention)  # Use sigmoid for attention weights
+
     def forward(self, x):
+        # Attention only depends on which pooled cell each pixel falls into,
+        # so compute it on the small grid of cell combinations and expand.
+        pools = [F.adaptive_avg_pool2d(x, output_size=(n, n)) for n in self.pool_sizes]
+        h, w = x.shape[2:]
+        rows, row_lengths = segment_index(
+            [nearest_index(b.shape[2], h, x.device) for b in pools]
+        )
+        cols, col_lengths = segment_index(
+            [nearest_index(b.shape[3], w, x.device) for b in pools]
+        )
+        grid = torch.cat(
+            [b[:, :, iy][:, :, :, ix] for b, iy, ix in zip(pools, rows, cols)], dim=1
+        )
+        attention = self.attention(grid)
+        attention = attention.repeat_interleave(row_lengths, dim=2, output_size=h)
+        attention = attention.repeat_interleave(col_lengths, dim=3, output_size=w)
+        return x * attention
+
+    def forward_reference(self, x):
         # Split into branches
         branches = [
-            F.adaptive_avg_pool2d(x, output_size=(1, 1)),
-            F.adaptive_avg_pool2d(x, output_size=(2, 2)),
-            F.adaptive_avg_pool2d(x, output_size=(4, 4)),
-            F.adaptive_avg_pool2d(x, output_size=(8, 8)),
+            F.adaptive_avg_pool2d(x, output_size=(n, n)) for n in self.pool_sizes
         ]
         branches = [
             F.interpolate(b, size=x.shape[2:], mode="nearest") for b in branches
@@ -45,10 +70,7 @@ class PyramidSqueezeAttention(nn.Module):
 
         # Concatenate branches
         concat = torch.cat(branches, dim=1)  # Concatenate along the channel dimension
-        attention = self.conv1(concat)
-        attention = self.conv2(attention)
-        attention = self.sigmoid(attention)  # Use sigmoid for attention weights
-        return x * attention
+        return x * self.attention(concat)
 
 
 class DehazeNet(nn.Module):
@@ -117,3 +139,9 @@ if __name__ == "__main__":
     input_tensor = torch.randn(1, 3, 256, 256)
     output = model(input_tensor)
     print("Output shape:", output.shape)
+
+    # Compare the optimized PSA with the reference implementation
+    with torch.no_grad():
+        features = torch.rand(1, 16, 270, 481)
+        diff = (model.psa(features) - model.psa.forward_reference(features)).abs().max()
+    print("PSA max abs diff:", diff.item())
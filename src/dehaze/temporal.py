@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import math
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from src.config import (
+    DEHAZE_TEMPORAL_DIFF_THRESHOLD,
+    DEHAZE_TEMPORAL_DRIFT_INTERVAL,
+    DEHAZE_TEMPORAL_REFRESH_INTERVAL,
+)
+from src.dehaze.engine import DehazeEngine
+
+
+class TemporalDehazer:
+    """视频去雾的时域统计量缓存
+
+    dehaze_net 中 PONO-MS 的均值/标准差和 PSA 的金字塔池化都是整帧的全局统计量，
+    在相邻帧之间变化缓慢。本类在刷新帧上完整计算并缓存这些统计量，其余帧直接复用，
+    省去整帧归约，且 PSA 注意力只需在池化网格上计算一次。每 refresh_interval 帧，
+    或缩略图与上次刷新帧的平均差异超过 diff_threshold（0-255）时重新计算。
+    每 drift_interval 个复用帧额外做一次完整推理，统计与完整计算的误差。
+
+    每个视频流使用独立实例；不支持分段推理的网络和需要分块的大图退化为完整推理。
+    """
+
+    def __init__(
+        self,
+        engine: DehazeEngine,
+        refresh_interval: int = DEHAZE_TEMPORAL_REFRESH_INTERVAL,
+        diff_threshold: float = DEHAZE_TEMPORAL_DIFF_THRESHOLD,
+        drift_interval: int = DEHAZE_TEMPORAL_DRIFT_INTERVAL,
+    ):
+        self.engine = engine
+        self.model = engine.dehaze_net
+        self.refresh_interval = max(1, refresh_interval)
+        self.diff_threshold = diff_threshold
+        self.drift_interval = drift_interval
+        self.enabled = hasattr(self.model, "body")
+
+        self._stats = None
+        self._pools = None
+        self._attention = None
+        self._reference_thumb: Optional[torch.Tensor] = None
+        self._since_refresh = 0
+
+        self.frames = 0
+        self.refreshes = 0
+        self._reused = 0
+        self._drift_errors: list[float] = []
+        self._drift_psnr: list[float] = []
+
+    @staticmethod
+    def _thumbnail(frame: torch.Tensor) -> torch.Tensor:
+        return F.adaptive_avg_pool2d(frame.mean(dim=0, keepdim=True), (36, 64)) * 255.0
+
+    def _needs_refresh(self, frame: torch.Tensor) -> bool:
+        """判断当前帧是否需要重新计算统计量，需要时记录为新的参考帧"""
+        thumb = self._thumbnail(frame)
+        refresh = (
+            self._reference_thumb is None
+            or self._since_refresh >= self.refresh_interval
+            or float((thumb - self._reference_thumb).abs().mean()) > self.diff_threshold
+        )
+        if refresh:
+            self._reference_thumb = thumb
+            self._since_refresh = 0
+        self._since_refresh += 1
+        return refresh
+
+    def _full(self, x: torch.Tensor, cache: bool) -> torch.Tensor:
+        model = self.model
+        x1, x2 = model.head(x)
+        mean1, std1 = model.pono_ms.stats(x1)
+        mean2, std2 = model.pono_ms.stats(x2)
+        stats = (mean1, std1, mean2, std2)
+        x5, x6 = model.body(x1, x2, stats)
+        pools = model.psa.pool(x6)
+        psa = model.psa(x6, pools=pools)
+        if cache:
+            self._stats, self._pools = stats, pools
+            self._attention = None
+            self.refreshes += 1
+        return model.tail(x, x5, x6, psa)
+
+    def _cached(self, x: torch.Tensor) -> torch.Tensor:
+        model = self.model
+        x1, x2 = model.head(x)
+        x5, x6 = model.body(x1, x2, self._stats)
+        if self._attention is None or self._attention.shape[2:] != x6.shape[2:]:
+            # 池化结果固定时注意力图与输入无关，刷新前只需计算一次
+            ones = torch.ones_like(x6[:1])
+            self._attention = model.psa(ones, pools=self._pools)
+        return model.tail(x, x5, x6, x6 * self._attention)
+
+    def _check_drift(self, x: torch.Tensor, output: torch.Tensor) -> None:
+        expected = self._full(x, cache=False)
+        error = (output - expected).abs()
+        self._drift_errors.append(float(error.mean()))
+        mse = float(error.square().mean())
+        if mse > 0:
+            self._drift_psnr.append(10 * math.log10(1.0 / mse))
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """对一批连续帧（NCHW float32）去雾"""
+        if not self.enabled or (
+            self.engine.tiler is not None and self.engine.tiler.needs_tiling(*batch.shape[2:])
+        ):
+            self.frames += batch.shape[0]
+            return self.engine.forward(batch)
+
+        with torch.inference_mode():
+            refresh = [self._needs_refresh(frame) for frame in batch]
+            outputs = []
+            start = 0
+            # 按刷新点切分为若干段，每段共用同一组统计量
+            for end in range(1, len(refresh) + 1):
+                if end < len(refresh) and not refresh[end]:
+                    continue
+                if refresh[start]:
+                    outputs.append(self._full(batch[start : start + 1], cache=True))
+                    start += 1
+                if start < end:
+                    segment = batch[start:end]
+                    output = self._cached(segment)
+                    for offset in range(segment.shape[0]):
+                        self._reused += 1
+                        if self.drift_interval > 0 and self._reused % self.drift_interval == 0:
+                            self._check_drift(segment[offset : offset + 1], output[offset : offset + 1])
+                    outputs.append(output)
+                start = end
+            self.frames += batch.shape[0]
+            return torch.cat(outputs)
+
+    def dehaze_frames(self, frames: list[np.ndarray]) -> list[np.ndarray]:
+        """对一批相同尺寸的连续 BGR 视频帧去雾，返回 BGR 帧"""
+        with torch.inference_mode():
+            batch = self.engine.to_tensor(frames).flip(1)
+            return self.engine.to_images(self.forward(batch).flip(1))
+
+    def stats(self) -> dict:
+        """复用率和与完整计算相比的误差"""
+        return {
+            "frames": self.frames,
+            "refreshes": self.refreshes,
+            "reuse_rate": self._reused / self.frames if self.frames else 0.0,
+            "drift": {
+                "checks": len(self._drift_errors),
+                "mean_abs_error": float(np.mean(self._drift_errors)) if self._drift_errors else None,
+                "max_abs_error": max(self._drift_errors) if self._drift_errors else None,
+                "min_psnr": min(self._drift_psnr) if self._drift_psnr else None,
+            },
+        }
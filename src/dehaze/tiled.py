@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from typing import Iterator
+
+import torch
+
+from src.dehaze.model import dehaze_net
+
+
+# 网络的感受野半径：e_conv2(1) + e_conv3(3) + e_conv4(3) + e_conv5..e_conv9(各1)
+RECEPTIVE_HALO = 12
+
+
+def _spans(size: int, tile: int, stride: int) -> list[tuple[int, int]]:
+    """按步长切分 [0, size)，最后一块贴齐末端"""
+    if size <= tile:
+        return [(0, size)]
+    starts = list(range(0, size - tile, stride)) + [size - tile]
+    return [(start, start + tile) for start in starts]
+
+
+def _tiles(
+    height: int, width: int, tile: int, stride: int
+) -> Iterator[tuple[int, int, int, int]]:
+    for y0, y1 in _spans(height, tile, stride):
+        for x0, x1 in _spans(width, tile, stride):
+            yield y0, y1, x0, x1
+
+
+class TiledDehazer:
+    """分块去雾
+
+    高分辨率图像按块推理，每块向外扩展感受野大小的边缘（halo），
+    只保留中心区域，因此分块边界处的卷积结果与整图推理一致。
+    PONO-MS 的均值/标准差和 PSA 的金字塔池化依赖整幅图像，先用不重叠的
+    分块流式累加得到全局统计量，再逐块计算输出。重叠区域按线性权重羽化融合。
+    内存占用只与分块大小有关。
+    """
+
+    def __init__(
+        self,
+        model: dehaze_net,
+        tile_size: int = 512,
+        overlap: int = 32,
+        halo: int = RECEPTIVE_HALO,
+    ):
+        if tile_size <= overlap:
+            raise ValueError("tile_size 必须大于 overlap")
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.halo = max(halo, RECEPTIVE_HALO)
+
+    def needs_tiling(self, height: int, width: int) -> bool:
+        return height > self.tile_size or width > self.tile_size
+
+    def _crop(self, x: torch.Tensor, y0: int, y1: int, x0: int, x1: int):
+        """取出带 halo 的分块，返回分块和中心区域在分块内的切片"""
+        height, width = x.shape[2:]
+        top, left = max(0, y0 - self.halo), max(0, x0 - self.halo)
+        bottom, right = min(height, y1 + self.halo), min(width, x1 + self.halo)
+        core = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        return x[:, :, top:bottom, left:right], core, (top, left)
+
+    def _partition(self, x: torch.Tensor):
+        height, width = x.shape[2:]
+        return _tiles(height, width, self.tile_size, self.tile_size)
+
+    def _pono_stats(self, x: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        """流式累加 x1、x2 的逐通道和与平方和（float64），得到整图的均值和无偏标准差"""
+        sums = [0.0, 0.0]
+        squares = [0.0, 0.0]
+        count = x.shape[2] * x.shape[3]
+        for y0, y1, x0, x1 in self._partition(x):
+            crop, (cy, cx), _ = self._crop(x, y0, y1, x0, x1)
+            for i, feature in enumerate(self.model.head(crop)):
+                core = feature[:, :, cy, cx].double()
+                sums[i] = sums[i] + core.sum(dim=(2, 3), keepdim=True)
+                squares[i] = squares[i] + core.square().sum(dim=(2, 3), keepdim=True)
+
+        stats = []
+        for total, square in zip(sums, squares):
+            mean = total / count
+            var = (square - total * mean) / max(count - 1, 1)
+            stats.append(mean.float())
+            stats.append(var.clamp_(min=0).sqrt().float())
+        mean1, std1, mean2, std2 = stats
+        return mean1, std1, mean2, std2
+
+    def _psa_pools(self, x: torch.Tensor, stats) -> list[torch.Tensor]:
+        """按 adaptive_avg_pool2d 的分箱方式流式累加 x6，得到整图的金字塔池化结果"""
+        height, width = x.shape[2:]
+        pool_sizes = self.model.psa.pool_sizes
+        sums = [None] * len(pool_sizes)
+        for y0, y1, x0, x1 in self._partition(x):
+            crop, (cy, cx), _ = self._crop(x, y0, y1, x0, x1)
+            _, x6 = self.model.body(*self.model.head(crop), stats)
+            core = x6[:, :, cy, cx].double()
+            for k, n in enumerate(pool_sizes):
+                partial = core.new_zeros(core.shape[0], core.shape[1], n, n)
+                for i in range(n):
+                    a, b = _bin(i, n, height)
+                    a, b = max(a, y0), min(b, y1)
+                    if a >= b:
+                        continue
+                    rows = core[:, :, a - y0 : b - y0].sum(dim=2)
+                    for j in range(n):
+                        c, d = _bin(j, n, width)
+                        c, d = max(c, x0), min(d, x1)
+                        if c < d:
+                            partial[:, :, i, j] = rows[:, :, c - x0 : d - x0].sum(dim=2)
+                sums[k] = partial if sums[k] is None else sums[k] + partial
+
+        pools = []
+        for total, n in zip(sums, pool_sizes):
+            rows = [_bin(i, n, height) for i in range(n)]
+            cols = [_bin(j, n, width) for j in range(n)]
+            area = torch.tensor(
+                [[(b - a) * (d - c) for c, d in cols] for a, b in rows],
+                dtype=torch.float64,
+                device=total.device,
+            )
+            pools.append((total / area).float())
+        return pools
+
+    def _feather(self, y0: int, y1: int, x0: int, x1: int, height: int, width: int, device):
+        """分块融合权重：与相邻分块重叠的边缘线性衰减，图像边界处保持为1"""
+
+        def ramp(start: int, end: int, size: int) -> torch.Tensor:
+            weight = torch.ones(end - start, device=device)
+            n = min(self.overlap, end - start)
+            if n > 0:
+                edge = torch.arange(1, n + 1, device=device, dtype=torch.float32) / (n + 1)
+                if start > 0:
+                    weight[:n] = edge
+                if end < size:
+                    weight[-n:] = torch.minimum(weight[-n:], edge.flip(0))
+            return weight
+
+        return ramp(y0, y1, height).view(-1, 1) * ramp(x0, x1, width).view(1, -1)
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        """对 NCHW float32 张量分块去雾，结果与整图推理一致"""
+        height, width = x.shape[2:]
+        if not self.needs_tiling(height, width):
+            return self.model(x)
+
+        stats = self._pono_stats(x)
+        pools = self._psa_pools(x, stats)
+
+        output = torch.zeros_like(x)
+        weights = x.new_zeros(1, 1, height, width)
+        stride = self.tile_size - self.overlap
+        for y0, y1, x0, x1 in _tiles(height, width, self.tile_size, stride):
+            crop, (cy, cx), offset = self._crop(x, y0, y1, x0, x1)
+            x5, x6 = self.model.body(*self.model.head(crop), stats)
+            psa = self.model.psa(x6, pools=pools, full_size=(height, width), offset=offset)
+            clean = self.model.tail(crop, x5, x6, psa)[:, :, cy, cx]
+
+            weight = self._feather(y0, y1, x0, x1, height, width, x.device)
+            output[:, :, y0:y1, x0:x1] += clean * weight
+            weights[:, :, y0:y1, x0:x1] += weight
+        return output.div_(weights)
+
+
+def _bin(index: int, bins: int, size: int) -> tuple[int, int]:
+    """adaptive_avg_pool2d 第 index 个分箱覆盖的范围 [start, end)"""
+    return (index * size) // bins, ((index + 1) * size + bins - 1) // bins
+
+
+if __name__ == "__main__":
+    # 与整图推理的一致性检查
+    torch.manual_seed(0)
+    model = dehaze_net().eval()
+    image = torch.rand(1, 3, 300, 420)
+    with torch.inference_mode():
+        expected = model(image)
+        actual = TiledDehazer(model, tile_size=128, overlap=16)(image)
+    print(f"max abs diff: {(expected - actual).abs().max().item():.2e}")
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import cv2
+
+from src.config import DEHAZE_FOLDER
+from src.dehaze.engine import DehazeEngine, get_dehaze_engine
+from src.dehaze.temporal import TemporalDehazer
+from src.video_io import AsyncVideoWriter, ThreadedBatchMap, ThreadedFrameReader
+
+
+def dehaze_stage(
+    frames,
+    engine: Optional[Union[DehazeEngine, TemporalDehazer]] = None,
+    batch_size: int = 4,
+    queue_size: int = 8,
+) -> ThreadedBatchMap:
+    """在流水线中插入去雾阶段：在独立线程中按批去雾，输出 BGR 帧
+
+    Args:
+        frames: BGR 帧迭代器
+        engine (DehazeEngine | TemporalDehazer): 去雾引擎，为None时使用进程内共享引擎
+        batch_size (int): 每次推理的帧数
+        queue_size (int): 输出队列长度
+
+    Returns:
+        ThreadedBatchMap: 可迭代的去雾后帧序列，使用完毕后需调用 close()
+    """
+    engine = engine or get_dehaze_engine()
+    return ThreadedBatchMap(
+        frames,
+        engine.dehaze_frames,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        name="dehaze-stage",
+    )
+
+
+def dehaze_video(
+    video_path: str,
+    save_folder: Path = Path(DEHAZE_FOLDER),
+    batch_size: int = 4,
+    queue_size: int = 8,
+    temporal: bool = False,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> tuple[str, float, dict]:
+    """视频去雾
+
+    解码、去雾、编码分别在三个线程中执行，各阶段之间通过有界队列连接。
+
+    Args:
+        video_path (str): 输入视频路径
+        save_folder (Path): 输出目录
+        batch_size (int): 每次去雾推理的帧数
+        queue_size (int): 各阶段之间的队列长度
+        temporal (bool): 是否在相邻帧之间复用去雾的全局统计量
+        cancel_check (Callable): 每帧调用，任务被取消时应抛出异常以中止处理
+        progress_callback (Callable): 参数为已处理帧数和总帧数
+
+    Raises:
+        ValueError: 无法读取视频文件
+
+    Returns:
+        str: 输出视频路径
+        float: 总耗时
+        dict: 处理统计信息
+    """
+    start_time = time.time()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("无法读取视频文件")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    save_folder.mkdir(parents=True, exist_ok=True)
+    output_path = str(save_folder / f"{Path(video_path).stem}_dehazed.mp4")
+    out = cv2.VideoWriter(
+        output_path, cv2.VideoWriter_fourcc(*"avc1"), fps, (frame_width, frame_height)
+    )
+
+    reader = ThreadedFrameReader(cap, queue_size=queue_size)
+    dehazer = TemporalDehazer(get_dehaze_engine()) if temporal else get_dehaze_engine()
+    stage = dehaze_stage(reader, dehazer, batch_size=batch_size, queue_size=queue_size)
+    writer = AsyncVideoWriter(out, queue_size=queue_size)
+    frame_count = 0
+    try:
+        for frame in stage:
+            if cancel_check is not None:
+                cancel_check()
+            writer.write(frame)
+            frame_count += 1
+            if progress_callback is not None:
+                progress_callback(frame_count, max(total_frames, frame_count))
+    finally:
+        stage.close()
+        reader.close()
+        writer.release()
+        cap.release()
+
+    process_time = time.time() - start_time
+    stats = {
+        "frames": frame_count,
+        "fps": frame_count / process_time if process_time > 0 else 0.0,
+        "batch_size": batch_size,
+        "stage_times": {
+            "decode": reader.decode_time,
+            "dehaze": stage.elapsed,
+            "encode": writer.encode_time,
+        },
+    }
+    if temporal:
+        stats["temporal"] = dehazer.stats()
+    return output_path, process_time, stats
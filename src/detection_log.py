@@ -0,0 +1,201 @@
+import bisect
+import json
+import os
+import uuid
+from typing import List, Optional
+
+import numpy as np
+
+
+DETECTION_FORMATS = ("jsonl", "columnar")
+
+# 列式文件：8字节文件头 + 定长记录，每个检测框一条记录，按帧序号递增
+COLUMNAR_MAGIC = b"BDDET01\n"
+COLUMNAR_DTYPE = np.dtype(
+    [
+        ("frame", "<i4"),
+        ("ts", "<f8"),
+        ("x1", "<i4"),
+        ("y1", "<i4"),
+        ("x2", "<i4"),
+        ("y2", "<i4"),
+        ("conf", "<f4"),
+        ("keyframe", "u1"),
+    ]
+)
+
+# JSONL 稀疏索引的间隔（行）
+JSONL_INDEX_INTERVAL = 256
+
+# 列式文件按范围读取时每次从映射中复制的记录数
+COLUMNAR_READ_CHUNK = 4096
+
+
+def detections_path(folder: str, run_id: Optional[str], fmt: str) -> str:
+    """检测结果文件路径，按任务ID命名，同一视频的多次检测互不覆盖
+
+    Args:
+        folder: 输出目录
+        run_id: 任务ID，None 时生成随机ID
+        fmt: "jsonl" 或 "columnar"
+    """
+    run_id = run_id or uuid.uuid4().hex
+    return os.path.join(folder, f"{run_id}_detections." + ("jsonl" if fmt == "jsonl" else "bin"))
+
+
+class DetectionWriter:
+    """逐帧写出检测结果，处理过程中不在内存中累积
+
+    jsonl 每个有检测框的帧一行 {"frame", "ts", "keyframe", "detections"}，关闭时写出
+    稀疏索引（<path>.idx）以支持按范围读取；columnar 每个检测框一条定长记录，
+    字段为 COLUMNAR_DTYPE。
+
+    Args:
+        path: 输出文件路径
+        fmt: "jsonl" 或 "columnar"
+    """
+
+    def __init__(self, path: str, fmt: str = "jsonl"):
+        if fmt not in DETECTION_FORMATS:
+            raise ValueError(f"不支持的检测结果格式: {fmt}")
+        self.path = path
+        self.format = fmt
+        self.frames = 0
+        self.boxes = 0
+        self._file = open(path, "wb")
+        self._index = {"frames": [], "timestamps": [], "offsets": []}
+        if fmt == "columnar":
+            self._file.write(COLUMNAR_MAGIC)
+
+    def write(self, frame: int, timestamp: float, detections: list, keyframe: bool = True) -> None:
+        if not detections:
+            return
+        if self.format == "jsonl":
+            if self.frames % JSONL_INDEX_INTERVAL == 0:
+                self._index["frames"].append(frame)
+                self._index["timestamps"].append(timestamp)
+                self._index["offsets"].append(self._file.tell())
+            line = {"frame": frame, "ts": timestamp, "keyframe": keyframe, "detections": detections}
+            self._file.write(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+        else:
+            records = np.empty(len(detections), dtype=COLUMNAR_DTYPE)
+            records["frame"] = frame
+            records["ts"] = timestamp
+            records["keyframe"] = keyframe
+            for record, det in zip(records, detections):
+                record["x1"], record["y1"], record["x2"], record["y2"] = det["bbox"]
+                record["conf"] = det["confidence"]
+            self._file.write(records.tobytes())
+        self.frames += 1
+        self.boxes += len(detections)
+
+    def close(self) -> None:
+        self._file.close()
+        if self.format == "jsonl":
+            with open(self.path + ".idx", "w") as f:
+                json.dump(self._index, f)
+
+
+def _read_jsonl(path: str, key: str, start: float, end: float, limit: int) -> List[dict]:
+    offset = 0
+    try:
+        with open(path + ".idx") as f:
+            index = json.load(f)
+        # 从最后一个不晚于起点的索引位置开始顺序读取
+        keys = index["frames" if key == "frame" else "timestamps"]
+        pos = bisect.bisect_right(keys, start) - 1
+        if pos >= 0:
+            offset = index["offsets"][pos]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    frames = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # 仍在写入中的最后一行
+                break
+            item = json.loads(line)
+            if item[key] < start:
+                continue
+            if item[key] > end or len(frames) >= limit:
+                break
+            frames.append(item)
+    return frames
+
+
+def _read_columnar(path: str, key: str, start: float, end: float, limit: int) -> List[dict]:
+    with open(path, "rb") as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError("检测结果文件格式错误")
+    count = (os.path.getsize(path) - len(COLUMNAR_MAGIC)) // COLUMNAR_DTYPE.itemsize
+    if count == 0:
+        return []
+    records = np.memmap(
+        path, dtype=COLUMNAR_DTYPE, mode="r", offset=len(COLUMNAR_MAGIC), shape=(count,)
+    )
+    # 记录按帧序号递增，二分查找范围后分块读取，凑满 limit 帧即停止
+    column = records["frame" if key == "frame" else "ts"]
+    lo = int(np.searchsorted(column, start, side="left"))
+    hi = int(np.searchsorted(column, end, side="right"))
+
+    frames = []
+    for chunk_start in range(lo, hi, COLUMNAR_READ_CHUNK):
+        chunk = np.array(records[chunk_start : min(chunk_start + COLUMNAR_READ_CHUNK, hi)])
+        for record in chunk:
+            frame = int(record["frame"])
+            if not frames or frames[-1]["frame"] != frame:
+                if len(frames) >= limit:
+                    return frames
+                frames.append(
+                    {
+                        "frame": frame,
+                        "ts": float(record["ts"]),
+                        "keyframe": bool(record["keyframe"]),
+                        "detections": [],
+                    }
+                )
+            frames[-1]["detections"].append(
+                {
+                    "bbox": [
+                        int(record["x1"]),
+                        int(record["y1"]),
+                        int(record["x2"]),
+                        int(record["y2"]),
+                    ],
+                    "confidence": float(record["conf"]),
+                    "label": "Person",
+                }
+            )
+    return frames
+
+
+def read_detections(
+    path: str,
+    fmt: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    unit: str = "s",
+    limit: int = 5000,
+) -> List[dict]:
+    """按范围读取检测结果，两种格式返回相同结构
+
+    Args:
+        path: 检测结果文件路径
+        fmt: "jsonl" 或 "columnar"
+        start: 范围起点（含），None 表示从头开始
+        end: 范围终点（含），None 表示到结尾
+        unit: "s" 按时间戳（秒），"frame" 按帧序号
+        limit: 最多返回的帧数
+
+    Returns:
+        [{"frame", "ts", "keyframe", "detections": [{"bbox", "confidence", "label"}]}]
+    """
+    if fmt not in DETECTION_FORMATS:
+        raise ValueError(f"不支持的检测结果格式: {fmt}")
+    key = "frame" if unit == "frame" else "ts"
+    start = float("-inf") if start is None else start
+    end = float("inf") if end is None else end
+    reader = _read_jsonl if fmt == "jsonl" else _read_columnar
+    return reader(path, key, start, end, limit)
@@ -0,0 +1,196 @@
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from src.config import FUSION_LEARNED_PATH, FUSION_STRATEGY
+
+
+FUSION_STRATEGIES = ("weighted", "channel", "max", "learned")
+
+
+class CropResizeMap:
+    """将“裁剪+缩放”预计算为 cv2.remap 查找表，结果直接写入目标缓冲区
+
+    采样位置与 cv2.resize(INTER_LINEAR) 相同（像素中心对齐，越界时复制裁剪区边缘），
+    查找表按源帧尺寸缓存，源帧尺寸变化时重建。
+
+    Args:
+        crop_params: 裁剪区域 (x, y, w, h)
+        resolution: 输出尺寸 (宽, 高)
+    """
+
+    def __init__(self, crop_params: Sequence[int], resolution: Tuple[int, int]):
+        self.crop_params = tuple(map(int, crop_params))
+        self.resolution = tuple(resolution)
+        self._source_shape: Optional[Tuple[int, int]] = None
+        self._maps = None
+
+    def _build(self, height: int, width: int) -> None:
+        x, y, w, h = self.crop_params
+        # 与切片一致，裁剪区域超出画面的部分被截掉
+        x0, y0 = min(max(x, 0), width - 1), min(max(y, 0), height - 1)
+        x1, y1 = min(x + w, width), min(y + h, height)
+        out_w, out_h = self.resolution
+
+        map_x = x0 + (np.arange(out_w, dtype=np.float32) + 0.5) * ((x1 - x0) / out_w) - 0.5
+        map_y = y0 + (np.arange(out_h, dtype=np.float32) + 0.5) * ((y1 - y0) / out_h) - 0.5
+        np.clip(map_x, x0, x1 - 1, out=map_x)
+        np.clip(map_y, y0, y1 - 1, out=map_y)
+        map_x, map_y = np.meshgrid(map_x, map_y)
+        # 转为定点格式，remap 时查表更快
+        self._maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        self._source_shape = (height, width)
+
+    def __call__(self, frame: np.ndarray, out: np.ndarray) -> np.ndarray:
+        if frame.shape[:2] != self._source_shape:
+            self._build(*frame.shape[:2])
+        return cv2.remap(
+            frame,
+            self._maps[0],
+            self._maps[1],
+            cv2.INTER_LINEAR,
+            dst=out,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+
+
+def load_learned_weights(path: str = FUSION_LEARNED_PATH) -> Tuple[np.ndarray, np.ndarray]:
+    """加载1x1卷积融合权重
+
+    文件为 .npz，weight 形状为 (3, 6) 或 PyTorch Conv2d 的 (3, 6, 1, 1)，输入通道依次为
+    IR 的 BGR 和 TR 的 BGR；bias 形状为 (3,)，可省略。
+
+    Returns:
+        (weight, bias)，weight 形状 (3, 6)
+    """
+    with np.load(path) as data:
+        weight = data["weight"].astype(np.float32).reshape(3, 6)
+        bias = data["bias"].astype(np.float32) if "bias" in data else np.zeros(3, np.float32)
+    return weight, bias
+
+
+class FrameFusion:
+    """IR/TR 双模态融合，所有中间结果写入预分配的缓冲区
+
+    fuse() 返回内部输出缓冲区，下一次调用时会被覆盖，需要跨帧保留时调用方自行复制。
+
+    Args:
+        ir_params: IR视频参数，包含 crop_params 和 resolution
+        tr_params: TR视频参数，包含 crop_params 和 resolution
+        strategy: 融合策略，见 FUSION_STRATEGIES
+        weights: weighted 时为 (IR权重, TR权重)；channel 时为形状 (2, 3) 的逐通道权重
+        learned_path: learned 策略的权重文件
+    """
+
+    def __init__(
+        self,
+        ir_params: dict,
+        tr_params: dict,
+        strategy: str = FUSION_STRATEGY,
+        weights=None,
+        learned_path: str = FUSION_LEARNED_PATH,
+    ):
+        if strategy not in FUSION_STRATEGIES:
+            raise ValueError(f"不支持的融合策略: {strategy}")
+        if tuple(ir_params["resolution"]) != tuple(tr_params["resolution"]):
+            raise ValueError("IR和TR的输出分辨率必须相同")
+
+        self.strategy = strategy
+        self.ir_map = CropResizeMap(ir_params["crop_params"], ir_params["resolution"])
+        self.tr_map = CropResizeMap(tr_params["crop_params"], tr_params["resolution"])
+
+        width, height = ir_params["resolution"]
+        shape = (height, width, 3)
+        self._ir = np.empty(shape, np.uint8)
+        self._tr = np.empty(shape, np.uint8)
+        self._out = np.empty(shape, np.uint8)
+        # 浮点策略使用的输入和累加缓冲区
+        self._in = None
+        self._acc = None
+        self._tmp = None
+
+        if strategy == "weighted":
+            self.weights = tuple(weights) if weights is not None else (0.3, 0.7)
+        elif strategy == "channel":
+            self.weights = (
+                np.asarray(weights, np.float32).reshape(2, 3)
+                if weights is not None
+                else np.array([[0.3] * 3, [0.7] * 3], np.float32)
+            )
+        elif strategy == "learned":
+            weight, bias = load_learned_weights(learned_path)
+            # 转置为 matmul 需要的 (输入通道, 输出通道)
+            self.weights = (
+                np.ascontiguousarray(weight[:, :3].T),
+                np.ascontiguousarray(weight[:, 3:].T),
+                bias + 0.5,
+            )
+
+        if strategy in ("channel", "learned"):
+            self._acc = np.empty(shape, np.float32)
+            self._tmp = np.empty(shape, np.float32)
+        if strategy == "learned":
+            self._in = np.empty(shape, np.float32)
+
+    def fuse(self, ir_frame: np.ndarray, tr_frame: np.ndarray) -> np.ndarray:
+        """裁剪缩放两路原始帧并融合，返回内部输出缓冲区"""
+        ir = self.ir_map(ir_frame, self._ir)
+        tr = self.tr_map(tr_frame, self._tr)
+        out = self._out
+
+        if self.strategy == "weighted":
+            cv2.addWeighted(ir, self.weights[0], tr, self.weights[1], 0, dst=out)
+        elif self.strategy == "max":
+            cv2.max(ir, tr, dst=out)
+        elif self.strategy == "channel":
+            np.multiply(ir, self.weights[0], out=self._acc)
+            np.multiply(tr, self.weights[1], out=self._tmp)
+            self._finish(self._acc, self._tmp, 0.5)
+        else:
+            ir_weight, tr_weight, bias = self.weights
+            # 1x1卷积即逐像素的通道线性变换
+            np.copyto(self._in, ir)
+            np.matmul(self._in, ir_weight, out=self._acc)
+            np.copyto(self._in, tr)
+            np.matmul(self._in, tr_weight, out=self._tmp)
+            self._finish(self._acc, self._tmp, bias)
+        return out
+
+    def _finish(self, acc: np.ndarray, tmp: np.ndarray, offset) -> None:
+        """acc + tmp + offset 截断到 [0, 255] 后写入输出缓冲区"""
+        np.add(acc, tmp, out=acc)
+        np.add(acc, offset, out=acc)
+        np.clip(acc, 0, 255, out=acc)
+        np.copyto(self._out, acc, casting="unsafe")
+
+
+def check_parity(
+    ir_params: dict, tr_params: dict, source_size: Tuple[int, int] = (1920, 1080)
+) -> dict:
+    """对比预计算查找表与原始“切片+resize+addWeighted”的输出差异
+
+    Returns:
+        {"max_abs_error", "mean_abs_error"}
+    """
+    rng = np.random.default_rng(0)
+    width, height = source_size
+    ir_frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    tr_frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    def reference(frame, params):
+        x, y, w, h = map(int, params["crop_params"])
+        return cv2.resize(frame[y : y + h, x : x + w], params["resolution"])
+
+    expected = cv2.addWeighted(
+        reference(ir_frame, ir_params), 0.3, reference(tr_frame, tr_params), 0.7, 0
+    )
+    fused = FrameFusion(ir_params, tr_params, strategy="weighted").fuse(ir_frame, tr_frame)
+    diff = np.abs(fused.astype(np.int16) - expected.astype(np.int16))
+    return {"max_abs_error": int(diff.max()), "mean_abs_error": float(diff.mean())}
+
+
+if __name__ == "__main__":
+    ir_params = {"crop_params": (100, 0, int(640 * 2.5), int(512 * 2.5)), "resolution": (640, 512)}
+    tr_params = {"crop_params": (0, 60, int(640 * 0.95), int(512 * 0.95)), "resolution": (640, 512)}
+    print(check_parity(ir_params, tr_params, source_size=(1920, 1080)))
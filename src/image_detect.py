@@ -1,10 +1,73 @@
 import cv2
-from ultralytics import YOLO
-from config import ROOT, DETECT_FOLDER
+import numpy as np
+from config import ROOT, DETECT_FOLDER, DETECT_BATCH_MAX_SIZE, DETECT_BATCH_MAX_WAIT_MS
+from src.micro_batcher import MicroBatcher
+from src.model_registry import model_registry
+from src.process_pool import detect_images_job, execution_backend
+from src.result_cache import content_digest, file_digest, make_key, result_cache
 from pathlib import Path
 import time
 
 
+# 图像检测的推理参数，同时作为结果缓存键的一部分，修改后旧的缓存条目自动失效
+DETECT_PARAMS = {"conf": 0.5, "classes": [0]}
+
+
+def to_detections(results) -> list:
+    """将YOLO检测结果转换为可序列化的检测列表"""
+    frame_detections = []
+    for box in results.boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        conf = float(box.conf[0])
+        frame_detections.append(
+            {"bbox": [x1, y1, x2, y2], "confidence": conf, "label": "Person"}
+        )
+    return frame_detections
+
+
+def draw_detections(frame: np.ndarray, detections: list) -> np.ndarray:
+    """在帧上原地绘制检测框
+
+    Args:
+        frame (np.ndarray): 视频帧
+        detections (list): 检测结果列表，每项包含 bbox 和 confidence
+
+    Returns:
+        np.ndarray: 绘制后的帧
+    """
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+
+        # 绘制边界框
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        # 添加标签
+        label = f"Person {det['confidence']:.2f}"
+        cv2.putText(
+            frame,
+            label,
+            (x1, y1 - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (0, 255, 0),
+            2,
+        )
+    return frame
+
+
+def draw_boxes(image: np.ndarray, results) -> np.ndarray:
+    """在图像副本上绘制检测框
+
+    Args:
+        image (np.ndarray): 原始图像
+        results: YOLO单张图像的检测结果
+
+    Returns:
+        np.ndarray: 绘制了检测框的图像
+    """
+    return draw_detections(image.copy(), to_detections(results))
+
+
 def detect_and_draw(
     image_path: str,
     model_path: str = "yolo11n.pt",
@@ -24,41 +87,148 @@ def detect_and_draw(
         str: 输出图像路径
         float: 检测耗时
     """
+    return detect_and_draw_batch([image_path], model_path, save_folder)[0]
+
+
+def detect_and_draw_batch(
+    image_paths: list[str],
+    model_path: str = "yolo11n.pt",
+    save_folder: Path = Path(DETECT_FOLDER),
+) -> list[tuple[str, float]]:
+    """在一次前向推理中批量检测并绘制边界框
+
+    命中结果缓存的图像直接写出缓存的标注图像，不再推理。
+
+    Args:
+        image_paths (list[str]): 输入图像路径列表
+        model_path (str): 模型路径
+        save_folder (Path): 输出目录
+
+    Raises:
+        ValueError: 无法读取图像文件
+
+    Returns:
+        list[tuple[str, float]]: 每张图像的输出路径和批次检测耗时
+    """
     start = time.time()
-    image = cv2.imread(image_path)
-    if image is None:
-        raise ValueError("无法读取图像文件")
-
-    model = YOLO(model_path)
-    # 对两个图像进行目标检测
-    results = model(image, conf=0.5, classes=[0], verbose=False)[0]
-    # 在红外图像上绘制检测框
-    annotated = image.copy()
-    for box in results.boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        conf = float(box.conf[0])
+    save_folder.mkdir(parents=True, exist_ok=True)  # 创建输出目录
+    output_paths = [str(save_folder / Path(image_path).name) for image_path in image_paths]
 
-        # 绘制边界框
-        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        # 添加标签
-        label = f"Person {conf:.2f}"
-        cv2.putText(
-            annotated,
-            label,
-            (x1, y1 - 10),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (0, 255, 0),
-            2,
+    # 结果缓存键：图像内容、模型文件和推理参数
+    model_digest = _model_digest(model_path)
+    keys, images, pending = [], [], []
+    for index, image_path in enumerate(image_paths):
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            raise ValueError("无法读取图像文件")
+        key = (
+            make_key(content_digest(data), model_digest, DETECT_PARAMS)
+            if model_digest
+            else None
         )
-    filename = Path(image_path).name
-    save_folder.mkdir(parents=True, exist_ok=True)  # 创建输出目录
-    output_path = str(save_folder / filename)
-    cv2.imwrite(output_path, annotated)
+        keys.append(key)
+        cached = result_cache.get(key) if key else None
+        if cached is not None:
+            _write_bytes(output_paths[index], cached[0])
+            continue
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("无法读取图像文件")
+        images.append(image)
+        pending.append(index)
+
+    if images:
+        with model_registry.acquire(model_path) as model:
+            # 整批图像一次前向推理
+            batch_results = model(images, **DETECT_PARAMS, verbose=False)
+
+        for index, image, results in zip(pending, images, batch_results):
+            ext = Path(output_paths[index]).suffix or ".jpg"
+            ok, buffer = cv2.imencode(ext, draw_boxes(image, results))
+            if not ok:
+                raise ValueError("图像编码失败")
+            data = buffer.tobytes()
+            _write_bytes(output_paths[index], data)
+            if keys[index]:
+                result_cache.put(keys[index], data, {"detections": to_detections(results)})
 
     end = time.time()
 
-    return output_path, end - start
+    return [(output_path, end - start) for output_path in output_paths]
+
+
+def _model_digest(model_path: str):
+    """模型文件的哈希，文件不存在时返回None（不缓存）"""
+    try:
+        return file_digest(model_registry.resolve(model_path))
+    except OSError:
+        return None
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def detect_arrays(
+    images: list[np.ndarray], model_path: str = "yolo11n.pt"
+) -> list[list]:
+    """对内存中的 BGR 图像批量检测，返回每张图像的检测列表"""
+    with model_registry.acquire(model_path) as model:
+        batch_results = model(images, **DETECT_PARAMS, verbose=False)
+    return [to_detections(results) for results in batch_results]
+
+
+def _detect_array_micro_batch(images: list[np.ndarray]) -> list:
+    """内存图像的微批处理函数，整批失败时逐张重试"""
+    try:
+        return detect_arrays(images)
+    except Exception:
+        if len(images) == 1:
+            raise
+    results = []
+    for image in images:
+        try:
+            results.append(detect_arrays([image])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _detect_micro_batch(image_paths: list[str]) -> list:
+    """微批处理函数，整批失败时逐张重试以隔离出错的图像"""
+    try:
+        return execution_backend.run(detect_images_job, image_paths)
+    except Exception:
+        if len(image_paths) == 1:
+            raise
+    results = []
+    for image_path in image_paths:
+        try:
+            results.append(execution_backend.run(detect_images_job, [image_path])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# 合并并发的单图检测请求；进程池后端下每个子进程可同时处理一个批次
+image_batcher = MicroBatcher(
+    _detect_micro_batch,
+    max_batch_size=DETECT_BATCH_MAX_SIZE,
+    max_wait_ms=DETECT_BATCH_MAX_WAIT_MS,
+    name="image-detect-batcher",
+    workers=execution_backend.workers if execution_backend.is_process else 1,
+)
+
+# 内存图像不跨进程传输，始终在当前进程中推理
+array_batcher = MicroBatcher(
+    _detect_array_micro_batch,
+    max_batch_size=DETECT_BATCH_MAX_SIZE,
+    max_wait_ms=DETECT_BATCH_MAX_WAIT_MS,
+    name="array-detect-batcher",
+)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import base64
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.config import IMAGE_FOLDER
+
+# 上传图片支持的扩展名，按顺序查找
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def find_upload_image(image_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """在上传目录中查找图片，返回 (图片名, 图片路径)，找不到时返回 (None, None)"""
+    for ext in IMAGE_EXTENSIONS:
+        image_name = f"{image_id}{ext}"
+        image_path = os.path.join(IMAGE_FOLDER, image_name)
+        if os.path.exists(image_path):
+            return image_name, image_path
+    return None, None
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """将图像文件字节解码为 BGR 数组
+
+    Raises:
+        ValueError: 数据为空或无法解码
+    """
+    if not data:
+        raise ValueError("图像数据为空")
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码图像数据")
+    return image
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    """将 BGR 数组编码为 JPEG 字节"""
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("图像编码失败")
+    return buffer.tobytes()
+
+
+def to_base64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def request_image_bytes(request) -> Optional[bytes]:
+    """从 Flask 请求中取出图像字节：优先 multipart 的 image 字段，其次原始请求体"""
+    file = request.files.get("image")
+    if file is not None:
+        return file.read()
+    return request.get_data(cache=False) or None
+
+
+def request_flag(request, name: str, default: bool = False) -> bool:
+    """解析布尔型查询参数"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def json_flag(data: dict, name: str, default: bool = False) -> bool:
+    """解析 JSON 请求体中的布尔型选项，接受布尔值、0/1 和 true/false/yes/no 字符串
+
+    Raises:
+        ValueError: 无法识别的取值
+    """
+    value = data.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ("1", "true", "yes", "0", "false", "no"):
+        return value.lower() in ("1", "true", "yes")
+    raise ValueError(f"Invalid boolean value for {name}")
@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 from flask import Flask, abort, send_file, request, render_template
 import sys
@@ -5,7 +6,7 @@ import sys
 from config import ROOT, UPLOAD_FOLDER
 
 sys.path.append(ROOT)
-from views import dehaze_view, detect_view, realtime_view, upload_view, task_view, val_view
+from views import dehaze_view, detect_view, pipeline_view, realtime_view, upload_view, task_view, val_view
 
 app = Flask(__name__, static_folder=os.path.join(ROOT, 'front', 'dist'),  # 设置静态文件夹目录
             template_folder=os.path.join(ROOT, 'front', 'dist'),
@@ -13,11 +14,16 @@ app = Flask(__name__, static_folder=os.path.join(ROOT, 'front', 'dist'),  # 设
 
 app.register_blueprint(dehaze_view.dehaze_bp)
 app.register_blueprint(detect_view.detect_bp)
+app.register_blueprint(pipeline_view.pipeline_bp)
 app.register_blueprint(realtime_view.realtime_bp)
 app.register_blueprint(upload_view.upload_dp)
 app.register_blueprint(task_view.task_bp)
 app.register_blueprint(val_view.val_bp)
 
+# 进程池工作进程以 spawn 方式启动时也会重新执行本模块，只在主进程中恢复任务状态
+if multiprocessing.parent_process() is None:
+    task_view.task_manager.recover_interrupted()
+
 
 @app.route("/")
 def index():
@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+from src.config import get_logger
+
+
+logger = get_logger()
+
+
+class MicroBatcher:
+    """动态微批处理器
+
+    将并发提交的单个任务合并为一个批次统一处理：凑满 max_batch_size
+    或等待超过 max_wait_ms 后立即执行一次批处理。
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10,
+        name: str = "micro-batcher",
+        workers: int = 1,
+    ):
+        """
+        Args:
+            process_batch: 批处理函数，输入为任务列表，按相同顺序返回结果列表
+            max_batch_size: 单批最大任务数
+            max_wait_ms: 第一个任务到达后等待凑批的最长时间（毫秒）
+            name: 工作线程名称
+            workers: 并行执行批处理的工作线程数
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """提交一个任务，返回可等待结果的Future"""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._loop,
+                    name=f"{self.name}-{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                logger.error(f"批处理失败: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
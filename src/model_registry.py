@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+from ultralytics import YOLO
+
+from src.config import MODEL_CACHE_MAX_BYTES, get_logger, get_model_path
+
+
+logger = get_logger()
+
+
+class _ModelEntry:
+    def __init__(self, model: YOLO, nbytes: int):
+        self.model = model
+        self.nbytes = nbytes
+        # ultralytics的predictor不是线程安全的，同一个模型的推理需要串行
+        self.lock = threading.RLock()
+
+
+class ModelRegistry:
+    """进程内共享的YOLO模型注册表
+
+    以 get_model_path 解析后的路径为键缓存模型实例，首次加载时进行预热，
+    超出内存预算时按LRU淘汰最久未使用的模型。
+    """
+
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES, warmup: bool = True):
+        self.max_bytes = max_bytes
+        self.warmup = warmup
+        self._entries: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolve(model_path: Optional[str] = None) -> str:
+        """将模型名称或路径解析为注册表的键"""
+        return os.path.normpath(get_model_path(model_path))
+
+    def get(self, model_path: Optional[str] = None) -> YOLO:
+        """获取（必要时加载）模型实例"""
+        return self._get_entry(model_path).model
+
+    @contextmanager
+    def acquire(self, model_path: Optional[str] = None) -> Iterator[YOLO]:
+        """获取模型并在使用期间持有该模型的推理锁
+
+        Args:
+            model_path: 模型名称或路径，为None时使用默认模型
+
+        Yields:
+            YOLO: 已预热的模型实例
+        """
+        entry = self._get_entry(model_path)
+        with entry.lock:
+            yield entry.model
+
+    def load_private(self, model_path: Optional[str] = None) -> YOLO:
+        """加载一个不进入缓存的独立模型实例
+
+        用于模型验证等长时间独占模型的任务，避免长时间持有共享实例的推理锁，
+        也不改动推理请求使用的实例状态。
+
+        Args:
+            model_path: 模型名称或路径，为None时使用默认模型
+
+        Returns:
+            YOLO: 新加载的模型实例（未预热）
+        """
+        key = self.resolve(model_path)
+        logger.info(f"加载独立模型实例: {key}")
+        return YOLO(key)
+
+    def evict(self, model_path: Optional[str] = None) -> None:
+        """从注册表中移除模型"""
+        key = self.resolve(model_path)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                logger.info(f"模型已移出缓存: {key}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "models": list(self._entries.keys()),
+                "total_bytes": sum(e.nbytes for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _get_entry(self, model_path: Optional[str]) -> _ModelEntry:
+        key = self.resolve(model_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # 同一模型只加载一次，其它线程等待加载完成
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry
+
+            entry = self._load(key)
+
+            with self._lock:
+                self._entries[key] = entry
+                self._loading.pop(key, None)
+                self._evict_over_budget(keep=key)
+        return entry
+
+    def _load(self, key: str) -> _ModelEntry:
+        logger.info(f"加载模型: {key}")
+        model = YOLO(key)
+        if self.warmup:
+            try:
+                # 预热：触发fuse和predictor初始化，避免首个请求承担这部分开销
+                model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+            except Exception as e:
+                logger.warning(f"模型预热失败: {key}, {str(e)}")
+        return _ModelEntry(model, self._estimate_bytes(model, key))
+
+    @staticmethod
+    def _estimate_bytes(model: YOLO, key: str) -> int:
+        module = getattr(model, "model", None)
+        if hasattr(module, "state_dict"):
+            return sum(t.numel() * t.element_size() for t in module.state_dict().values())
+        # 非PyTorch格式（如onnx）以文件大小估算
+        return os.path.getsize(key) if os.path.exists(key) else 0
+
+    def _evict_over_budget(self, keep: str) -> None:
+        total = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries.keys()):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).nbytes
+            logger.info(f"模型缓存超出预算，淘汰: {key}")
+
+
+model_registry = ModelRegistry()
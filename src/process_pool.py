@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+from src.config import (
+    EXECUTION_BACKEND,
+    PROCESS_POOL_WORKERS,
+    get_logger,
+    get_model_path,
+)
+from src.task_manager import ProgressTracker, TaskCancelled, TaskStatus, task_manager
+
+
+logger = get_logger()
+
+
+def _init_worker(model_paths: Sequence[Optional[str]], num_threads: int) -> None:
+    """子进程初始化：限制每个进程的计算线程数并预热模型"""
+    import torch
+
+    from src.model_registry import model_registry
+
+    torch.set_num_threads(num_threads)
+    for model_path in model_paths:
+        model_registry.get(model_path)
+    logger.info(f"Worker process {os.getpid()} ready")
+
+
+class ExecutionBackend:
+    """检测任务的执行后端
+
+    thread 模式下直接在调用线程中执行；process 模式下提交到常驻模型的
+    子进程池执行，绕开GIL。任务的输入输出均为文件路径等可序列化的小对象，
+    图像和视频数据不经过进程间传输。
+    """
+
+    def __init__(
+        self,
+        backend: str = EXECUTION_BACKEND,
+        workers: int = PROCESS_POOL_WORKERS,
+        warm_models: Sequence[Optional[str]] = (None,),
+    ):
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.warm_models = [get_model_path(m) for m in warm_models]
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_process(self) -> bool:
+        return self.backend == "process"
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """执行任务并返回结果，fn 必须是可被子进程导入的模块级函数"""
+        if not self.is_process:
+            return fn(*args, **kwargs)
+        return self._get_pool().submit(fn, *args, **kwargs).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.warm_models, num_threads),
+                )
+                logger.info(
+                    f"Process pool started: {self.workers} workers, {num_threads} threads each"
+                )
+            return self._pool
+
+
+def task_cancel_check(task_id: str, interval: float = 0.5) -> Callable[[], None]:
+    """基于任务存储的取消检查，可在子进程中使用（需要SQLite任务存储）"""
+    last_check = [0.0]
+
+    def check() -> None:
+        now = time.monotonic()
+        if now - last_check[0] < interval:
+            return
+        last_check[0] = now
+        task = task_manager.store.get(task_id)
+        if task is not None and task["status"] == TaskStatus.CANCELLED:
+            raise TaskCancelled(task_id)
+
+    return check
+
+
+def detect_video_job(task_id: str, video_path: str, options: dict) -> tuple:
+    """视频检测任务"""
+    from src.video_detect import detect_video
+
+    return detect_video(
+        video_path,
+        run_id=task_id,
+        cancel_check=task_cancel_check(task_id),
+        progress_callback=ProgressTracker(task_id),
+        **options,
+    )
+
+
+def dehaze_video_job(task_id: str, video_path: str, options: dict) -> tuple:
+    """视频去雾任务"""
+    from src.dehaze.video import dehaze_video
+
+    return dehaze_video(
+        video_path,
+        cancel_check=task_cancel_check(task_id),
+        progress_callback=ProgressTracker(task_id),
+        **options,
+    )
+
+
+def multimodal_detect_job(task_id: str, detector_kwargs: dict) -> tuple:
+    """多模态视频检测任务，返回输出视频路径和统计信息（帧数、帧率、编码、IR/TR帧配对）"""
+    from src.MultiModalVideoDetector import MultiModalVideoDetector
+
+    detector = MultiModalVideoDetector(**detector_kwargs)
+    detector.run(
+        cancel_check=task_cancel_check(task_id),
+        progress_callback=ProgressTracker(task_id),
+    )
+    return detector.output_path, detector.stats()
+
+
+def detect_images_job(image_paths: list) -> list:
+    """批量图像检测任务"""
+    from src.image_detect import detect_and_draw_batch
+
+    return detect_and_draw_batch(image_paths)
+
+
+def validate_job(model_path: str, task_dir: str) -> dict:
+    """数据集验证任务"""
+    from src.views.val_view import validate_with_model
+
+    return validate_with_model(model_path, task_dir)
+
+
+execution_backend = ExecutionBackend()
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+from typing import Optional, Sequence
+
+from src.config import REALTIME_IMGSZ_CHOICES, REALTIME_LATENCY_BUDGET, REALTIME_TARGET_FPS
+
+
+class AdaptiveImgsz:
+    """根据推理耗时在候选输入尺寸之间切换YOLO推理分辨率
+
+    以指数滑动平均跟踪每帧处理耗时：超过预算时降一档，低于预算的 headroom 倍时升一档。
+    每次切换后等待 cooldown 帧，避免在两档之间来回抖动。
+
+    Args:
+        choices: 候选输入尺寸（32的倍数），从小到大
+        target_fps: 目标处理帧率
+        latency_budget: 每帧处理耗时预算（秒），设置后优先于 target_fps
+        headroom: 升档阈值与预算之比
+        cooldown: 两次切换之间至少间隔的帧数
+    """
+
+    def __init__(
+        self,
+        choices: Sequence[int] = REALTIME_IMGSZ_CHOICES,
+        target_fps: float = REALTIME_TARGET_FPS,
+        latency_budget: Optional[float] = REALTIME_LATENCY_BUDGET,
+        headroom: float = 0.7,
+        cooldown: int = 10,
+    ):
+        self.choices = sorted(choices)
+        self.budget = latency_budget if latency_budget else 1.0 / target_fps
+        self.headroom = headroom
+        self.cooldown = cooldown
+        # 从最大尺寸开始，只在确实跟不上时降档
+        self.level = len(self.choices) - 1
+        self._ema: Optional[float] = None
+        self._since_switch = 0
+
+    @property
+    def imgsz(self) -> int:
+        return self.choices[self.level]
+
+    def update(self, seconds: float) -> int:
+        """记录一帧的处理耗时，返回下一帧使用的输入尺寸"""
+        self._ema = seconds if self._ema is None else 0.8 * self._ema + 0.2 * seconds
+        self._since_switch += 1
+        if self._since_switch < self.cooldown:
+            return self.imgsz
+
+        if self._ema > self.budget and self.level > 0:
+            self.level -= 1
+        elif self._ema < self.budget * self.headroom and self.level < len(self.choices) - 1:
+            self.level += 1
+        else:
+            return self.imgsz
+        # 分辨率变化后耗时会跟着变化，重新开始统计
+        self._ema = None
+        self._since_switch = 0
+        return self.imgsz
+
+    def stats(self) -> dict:
+        return {
+            "imgsz": self.imgsz,
+            "budget": self.budget,
+            "process_time_ema": self._ema,
+        }
+
+
+class LatencyTracker:
+    """统计实时模式的端到端延迟（帧可用到编码完成）和跳帧数
+
+    Args:
+        window: 计算分位数使用的最近帧数
+    """
+
+    def __init__(self, window: int = 300):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._skipped = 0
+        self._started_at = time.monotonic()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._processed += 1
+
+    def skip(self, frames: int) -> None:
+        with self._lock:
+            self._skipped += frames
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            processed, skipped = self._processed, self._skipped
+        elapsed = time.monotonic() - self._started_at
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+        return {
+            "processed": processed,
+            "skipped": skipped,
+            "fps": processed / elapsed if elapsed > 0 else 0.0,
+            "latency_mean": sum(latencies) / len(latencies) if latencies else None,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if latencies else None,
+        }
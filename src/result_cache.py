@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import (
+    RESULT_CACHE_DISK_BYTES,
+    RESULT_CACHE_FOLDER,
+    RESULT_CACHE_MEMORY_BYTES,
+    get_logger,
+)
+
+
+logger = get_logger()
+
+# 缓存值: (结果数据, 可JSON序列化的元信息)
+CacheValue = Tuple[bytes, Dict[str, Any]]
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """文件内容的哈希，按 (路径, 修改时间, 大小) 缓存，模型文件被替换后自动失效"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _file_digests_lock:
+        digest = _file_digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _file_digests_lock:
+            _file_digests[key] = digest
+    return digest
+
+
+def make_key(*parts: Any) -> str:
+    """由内容哈希、模型哈希和推理参数生成缓存键"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """推理结果缓存
+
+    内存层为按字节数限制的LRU；磁盘层位于 UPLOAD_FOLDER 下，每个条目一个文件，
+    超出容量时按最近访问时间淘汰。内存未命中时读取磁盘并回填内存层。
+
+    磁盘层由多个进程共享，每个进程只知道自己写入的字节数：本进程在上次扫描后
+    写入超过容量的 DISK_RESCAN_FRACTION 或估计值超出容量时重新扫描目录再淘汰，
+    N 个进程时目录最多超出容量约 N×DISK_RESCAN_FRACTION。扫描和删除不持有锁。
+    """
+
+    DISK_RESCAN_FRACTION = 0.1
+
+    def __init__(
+        self,
+        folder: str = RESULT_CACHE_FOLDER,
+        memory_max_bytes: int = RESULT_CACHE_MEMORY_BYTES,
+        disk_max_bytes: int = RESULT_CACHE_DISK_BYTES,
+    ):
+        self.folder = folder
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, CacheValue]" = OrderedDict()
+        self._memory_bytes = 0
+        # 最近一次扫描的目录大小加上本进程之后写入的字节数
+        self._disk_bytes: Optional[int] = None
+        self._disk_unscanned = 0
+        self._disk_scanning = False
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return value
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key: str, data: bytes, meta: Optional[Dict[str, Any]] = None) -> None:
+        value = (data, meta or {})
+        with self._lock:
+            self._put_memory(key, value)
+        try:
+            self._write_disk(key, value)
+        except OSError as e:
+            logger.warning(f"写入结果缓存失败: {str(e)}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for name in os.listdir(self.folder):
+                os.remove(os.path.join(self.folder, name))
+            self._disk_bytes = 0
+            self._disk_unscanned = 0
+
+    def stats(self) -> dict:
+        if self._disk_bytes is None:
+            self._refresh_disk(evict=False)
+        with self._lock:
+            lookups = sum(self._counters.values())
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _put_memory(self, key: str, value: CacheValue) -> None:
+        size = len(value[0])
+        if size > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[0])
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[0])
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key)
+
+    def _read_disk(self, key: str) -> Optional[CacheValue]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                data = f.read()
+            # 以修改时间记录最近访问，供淘汰使用
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return data, meta
+
+    def _write_disk(self, key: str, value: CacheValue) -> None:
+        data, meta = value
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(data)
+        size = os.path.getsize(tmp_path)
+        existed = os.path.exists(path)
+        old_size = os.path.getsize(path) if existed else 0
+        os.replace(tmp_path, path)
+
+        growth = max(size - old_size, 0)
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - old_size
+            self._disk_unscanned += growth
+            rescan = not self._disk_scanning and (
+                self._disk_bytes is None
+                or self._disk_bytes > self.disk_max_bytes
+                or self._disk_unscanned >= self.disk_max_bytes * self.DISK_RESCAN_FRACTION
+            )
+        if rescan:
+            self._refresh_disk(evict=True)
+
+    def _refresh_disk(self, evict: bool) -> None:
+        """重新扫描磁盘层（包括其它进程写入的条目），evict 时超出容量则淘汰"""
+        with self._lock:
+            if self._disk_scanning:
+                return
+            self._disk_scanning = True
+        try:
+            entries = self._scan_disk()
+            total = sum(size for _, size, _ in entries)
+            if evict and total > self.disk_max_bytes:
+                total = self._evict_disk(entries, total)
+            with self._lock:
+                self._disk_bytes = total
+                self._disk_unscanned = 0
+        except OSError as e:
+            logger.warning(f"扫描结果缓存目录失败: {str(e)}")
+        finally:
+            with self._lock:
+                self._disk_scanning = False
+
+    def _scan_disk(self) -> list:
+        """返回磁盘层条目 [(修改时间, 大小, 路径)]，忽略写入中的临时文件"""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    # 已被其它进程淘汰
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self, entries: list, total: int) -> int:
+        """按最近访问时间淘汰磁盘条目，直到低于容量的90%，返回淘汰后的大小"""
+        target = self.disk_max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # 可能已被其它进程删除
+                pass
+            total -= size
+        return total
+
+
+result_cache = ResultCache()
@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import threading
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.config import (
+    EXECUTION_BACKEND,
+    PROCESS_POOL_WORKERS,
+    SCHEDULER_MAX_QUEUE,
+    SCHEDULER_WORKERS,
+    get_logger,
+)
+from src.task_manager import TaskCancelled, TaskStatus, task_manager
+
+
+logger = get_logger()
+
+
+class JobPriority(IntEnum):
+    # 图像检测是同步请求，经微批处理器直接推理，不进入调度队列
+    NORMAL = 0  # 视频检测、去雾等任务，优先执行
+    BULK = 1  # 批量验证等后台任务
+
+
+class QueueFullError(Exception):
+    """调度队列已满"""
+
+
+class _Job:
+    def __init__(self, task_id: str, fn: Callable, args: Tuple, kwargs: Dict[str, Any]):
+        self.task_id = task_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+
+
+class JobScheduler:
+    """有界的后台任务调度器
+
+    固定数量的工作线程按优先级（同优先级先进先出）执行任务，排队任务数
+    超过上限时拒绝提交。排队中的任务可直接取消，执行中的任务通过
+    raise_if_cancelled 协作式取消。
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS, max_queue: int = SCHEDULER_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._heap: List[Tuple[int, int, _Job]] = []
+        self._counter = itertools.count()
+        self._jobs: Dict[str, _Job] = {}
+        self._running: Dict[str, _Job] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def submit(
+        self,
+        task_id: str,
+        fn: Callable,
+        args: Tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        priority: JobPriority = JobPriority.NORMAL,
+    ) -> None:
+        """创建任务并加入调度队列
+
+        Raises:
+            QueueFullError: 排队任务数已达上限
+        """
+        job = _Job(task_id, fn, args, kwargs or {})
+        with self._cond:
+            if self.queue_depth() >= self.max_queue:
+                raise QueueFullError("Too many queued tasks")
+            task_manager.create_task(task_id)
+            task_manager.update_task(task_id, TaskStatus.QUEUED)
+            self._jobs[task_id] = job
+            heapq.heappush(self._heap, (int(priority), next(self._counter), job))
+            self._ensure_workers()
+            self._cond.notify()
+
+    def is_full(self) -> bool:
+        with self._cond:
+            return self.queue_depth() >= self.max_queue
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(1 for *_, job in self._heap if not job.cancel_event.is_set())
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """返回任务在队列中的位置（从1开始），不在队列中时返回None"""
+        with self._cond:
+            waiting = [
+                job for *_, job in sorted(self._heap) if not job.cancel_event.is_set()
+            ]
+        for position, job in enumerate(waiting, start=1):
+            if job.task_id == task_id:
+                return position
+        return None
+
+    def cancel(self, task_id: str) -> bool:
+        """取消排队中或执行中的任务，任务已结束或不存在时返回False"""
+        with self._cond:
+            job = self._jobs.get(task_id)
+            if job is None:
+                return False
+            job.cancel_event.set()
+            # 排队中的任务直接出队
+            self._heap = [entry for entry in self._heap if entry[2] is not job]
+            heapq.heapify(self._heap)
+            if task_id not in self._running:
+                self._jobs.pop(task_id, None)
+
+        # 任务已结束时不会被改为取消
+        return task_manager.update_task(task_id, TaskStatus.CANCELLED, error="Task cancelled")
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._cond:
+            job = self._jobs.get(task_id)
+        return job is not None and job.cancel_event.is_set()
+
+    def raise_if_cancelled(self, task_id: str) -> None:
+        """供执行中的任务周期性调用，任务被取消时抛出TaskCancelled"""
+        if self.is_cancelled(task_id):
+            raise TaskCancelled(task_id)
+
+    def _ensure_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"job-worker-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancel_event.is_set():
+                    continue
+                self._running[job.task_id] = job
+
+            try:
+                job.fn(*job.args, **job.kwargs)
+            except TaskCancelled:
+                logger.info(f"Task cancelled: {job.task_id}")
+            except Exception as e:
+                logger.error(f"Job {job.task_id} failed: {str(e)}")
+                task_manager.update_task(job.task_id, TaskStatus.FAILED, error=str(e))
+            finally:
+                with self._cond:
+                    self._running.pop(job.task_id, None)
+                    self._jobs.pop(job.task_id, None)
+
+
+# 进程池后端下调度线程只负责派发和等待，数量与子进程数一致才能用满进程池
+job_scheduler = JobScheduler(
+    workers=max(SCHEDULER_WORKERS, PROCESS_POOL_WORKERS)
+    if EXECUTION_BACKEND == "process"
+    else SCHEDULER_WORKERS
+)
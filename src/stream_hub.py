@@ -0,0 +1,194 @@
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.config import STREAM_IDLE_TIMEOUT, STREAM_RING_SIZE, get_logger
+
+
+logger = get_logger()
+
+
+class FrameRing:
+    """固定容量的帧环形缓冲区，按递增序号保存最近的若干帧"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._frames: List[Optional[bytes]] = [None] * self.capacity
+        self._latest = -1
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def latest(self) -> int:
+        with self._cond:
+            return self._latest
+
+    def push(self, frame: bytes) -> None:
+        with self._cond:
+            self._latest += 1
+            self._frames[self._latest % self.capacity] = frame
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """标记数据源结束，唤醒所有等待的订阅者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def wait_next(self, last: int, timeout: float) -> Tuple[int, Optional[bytes], bool]:
+        """等待序号大于 last 的帧
+
+        落后超过缓冲区容量的订阅者直接跳到最新一帧。
+
+        Returns:
+            (序号, 帧数据, 是否已结束)，超时时帧数据为None
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest > last or self._closed, timeout):
+                return last, None, False
+            if self._latest <= last:
+                return last, None, self._closed
+            seq = last + 1 if self._latest - last < self.capacity else self._latest
+            return seq, self._frames[seq % self.capacity], False
+
+
+class StreamBroadcaster:
+    """单个视频流的共享生产者
+
+    第一个订阅者到来时在后台线程中启动生产者，生产者产出的已编码帧写入环形
+    缓冲区，所有订阅者从缓冲区读取，生产者从不等待订阅者。最后一个订阅者
+    离开 idle_timeout 秒后停止生产者并释放资源。每次启动生产者使用新的缓冲区，
+    订阅者只读取自己加入时的那一个。
+
+    Args:
+        name: 流名称
+        factory: 创建帧生成器的函数，生成器逐帧产出已编码的数据
+        ring_size: 环形缓冲区容量（帧）
+        idle_timeout: 无订阅者多长时间后停止生产者（秒）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Iterator[bytes]],
+        ring_size: int = STREAM_RING_SIZE,
+        idle_timeout: float = STREAM_IDLE_TIMEOUT,
+    ):
+        self.name = name
+        self.factory = factory
+        self.ring_size = ring_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._ring: Optional[FrameRing] = None
+        self._subscribers = 0
+        self._idle_since: Optional[float] = None
+        self._frames = 0
+        self._dropped = 0
+        self._started_at: Optional[float] = None
+
+    def subscribe(self) -> Iterator[bytes]:
+        """订阅流，返回逐帧产出数据的生成器；生成器关闭时自动退订"""
+        with self._lock:
+            self._subscribers += 1
+            self._idle_since = None
+            ring = self._ensure_producer()
+        try:
+            # 从最新一帧开始播放
+            last = max(ring.latest - 1, -1)
+            while True:
+                seq, frame, finished = ring.wait_next(last, timeout=1.0)
+                if finished:
+                    break
+                if frame is None:
+                    continue
+                if seq > last + 1:
+                    with self._lock:
+                        self._dropped += seq - last - 1
+                last = seq
+                yield frame
+        finally:
+            with self._lock:
+                self._subscribers -= 1
+                if self._subscribers == 0:
+                    self._idle_since = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "name": self.name,
+                "running": self._ring is not None,
+                "subscribers": self._subscribers,
+                "frames": self._frames,
+                "fps": self._frames / elapsed if elapsed > 0 else 0.0,
+                "dropped": self._dropped,
+            }
+
+    def _ensure_producer(self) -> FrameRing:
+        if self._ring is None:
+            self._ring = FrameRing(self.ring_size)
+            self._frames = 0
+            self._started_at = time.monotonic()
+            threading.Thread(
+                target=self._produce,
+                args=(self._ring,),
+                name=f"stream-{self.name}",
+                daemon=True,
+            ).start()
+        return self._ring
+
+    def _detach(self, ring: FrameRing) -> None:
+        if self._ring is ring:
+            self._ring = None
+
+    def _produce(self, ring: FrameRing) -> None:
+        source = None
+        try:
+            source = self.factory()
+            for frame in source:
+                ring.push(frame)
+                with self._lock:
+                    self._frames += 1
+                    idle = (
+                        self._subscribers == 0
+                        and self._idle_since is not None
+                        and time.monotonic() - self._idle_since > self.idle_timeout
+                    )
+                    if idle:
+                        # 在持锁时解除关联，之后到来的订阅者会启动新的生产者
+                        self._detach(ring)
+                if idle:
+                    logger.info(f"Stream {self.name} idle, stopping producer")
+                    break
+        except Exception as e:
+            logger.error(f"Stream {self.name} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._detach(ring)
+            if source is not None and hasattr(source, "close"):
+                source.close()
+            ring.close()
+
+
+class StreamHub:
+    """按名称管理共享视频流"""
+
+    def __init__(self):
+        self._streams: Dict[str, StreamBroadcaster] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, factory: Callable[[], Iterator[bytes]]) -> StreamBroadcaster:
+        with self._lock:
+            stream = self._streams.get(name)
+            if stream is None:
+                stream = StreamBroadcaster(name, factory)
+                self._streams[name] = stream
+            return stream
+
+    def stats(self) -> list:
+        with self._lock:
+            streams = list(self._streams.values())
+        return [stream.stats() for stream in streams]
+
+
+stream_hub = StreamHub()
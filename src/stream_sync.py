@@ -0,0 +1,254 @@
+import time
+from typing import Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.config import STREAM_DECODE_QUEUE_SIZE, STREAM_DECODE_THREADS, STREAM_SYNC_MODE
+from src.video_io import ThreadedFrameReader
+
+
+SYNC_MODES = ("timestamp", "fps")
+
+
+class StreamClock:
+    """逐帧抓取视频并给出相对起始帧的时间戳（毫秒）
+
+    timestamp 模式读取容器时间戳（CAP_PROP_POS_MSEC），时间戳不可用（不递增）时
+    改为按声明帧率递推；fps 模式始终按声明帧率计算。
+
+    Args:
+        cap: 已定位到起始帧的视频捕获
+        mode: "timestamp" 或 "fps"
+    """
+
+    def __init__(self, cap: cv2.VideoCapture, mode: str = STREAM_SYNC_MODE):
+        self.cap = cap
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.period = 1000.0 / self.fps
+        self.use_timestamps = mode == "timestamp"
+        self.index = -1
+        self.timestamp: Optional[float] = None
+        self.decode_time = 0.0
+        self._origin: Optional[float] = None
+        self._last_pos: Optional[float] = None
+
+    def grab(self) -> bool:
+        """抓取下一帧（不解码为图像），视频结束时返回False"""
+        start = time.perf_counter()
+        ok = self.cap.grab()
+        self.decode_time += time.perf_counter() - start
+        if not ok:
+            return False
+        self.index += 1
+
+        if self.use_timestamps:
+            pos = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+            if self._last_pos is None or pos > self._last_pos:
+                if self._origin is None:
+                    self._origin = pos
+                self._last_pos = pos
+                self.timestamp = pos - self._origin
+                return True
+            # 容器时间戳不递增，之后按帧率递推
+            self.use_timestamps = False
+
+        self.timestamp = 0.0 if self.timestamp is None else self.timestamp + self.period
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """将当前抓取的帧转换为图像"""
+        start = time.perf_counter()
+        result = self.cap.retrieve()
+        self.decode_time += time.perf_counter() - start
+        return result
+
+    def frames_left(self) -> float:
+        return self.cap.get(cv2.CAP_PROP_FRAME_COUNT) - self.cap.get(cv2.CAP_PROP_POS_FRAMES)
+
+    def close(self) -> None:
+        pass
+
+
+class ThreadedStreamClock:
+    """在独立线程中解码视频帧的 StreamClock，接口与 StreamClock 相同
+
+    解码线程抓取并转换每一帧，连同时间戳放入有界队列，grab() 从队列中取出下一帧。
+    与 StreamClock 不同，之后被跳过的帧也会被完整解码，换来的是两路解码并行、
+    不占用推理线程的时间。
+
+    Args:
+        cap: 已定位到起始帧的视频捕获
+        mode: "timestamp" 或 "fps"
+        queue_size: 解码队列长度
+        name: 解码线程名称
+    """
+
+    def __init__(
+        self,
+        cap: cv2.VideoCapture,
+        mode: str = STREAM_SYNC_MODE,
+        queue_size: int = STREAM_DECODE_QUEUE_SIZE,
+        name: str = "stream-decoder",
+    ):
+        self._clock = StreamClock(cap, mode)
+        self.cap = cap
+        self.fps = self._clock.fps
+        self.period = self._clock.period
+        self.index = -1
+        self.timestamp: Optional[float] = None
+        self._frame: Optional[np.ndarray] = None
+        # 解码线程启动后不再从本线程访问 cap
+        self._frames_left = self._clock.frames_left()
+        self._reader = ThreadedFrameReader(cap, queue_size=queue_size, read=self._read, name=name)
+        self._frames = iter(self._reader)
+
+    @property
+    def use_timestamps(self) -> bool:
+        return self._clock.use_timestamps
+
+    @property
+    def decode_time(self) -> float:
+        return self._clock.decode_time
+
+    def _read(self) -> Tuple[bool, Any]:
+        """在解码线程中执行：抓取并转换下一帧"""
+        if not self._clock.grab():
+            return False, None
+        ok, frame = self._clock.retrieve()
+        return ok, (self._clock.index, self._clock.timestamp, frame)
+
+    def grab(self) -> bool:
+        item = next(self._frames, None)
+        if item is None:
+            return False
+        self.index, self.timestamp, self._frame = item
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return self._frame is not None, self._frame
+
+    def frames_left(self) -> float:
+        return self._frames_left - (self.index + 1)
+
+    def close(self) -> None:
+        """停止解码线程，之后才能释放视频捕获"""
+        self._reader.close()
+
+
+class StreamSynchronizer:
+    """按时间戳配对两路视频的帧
+
+    以主路（IR）为准逐帧输出，副路（TR）取时间戳最接近的一帧：副路帧率较高时多余的帧
+    只抓取不转换为图像，帧率较低时复用上一次转换的图像。threaded 时两路各在独立线程中
+    解码，配对在调用线程中进行。
+
+    Args:
+        primary: 主路视频捕获，决定输出帧率
+        secondary: 副路视频捕获
+        mode: 时间戳来源，见 SYNC_MODES
+        threaded: 是否每路使用独立的解码线程
+        queue_size: threaded 时每路的解码队列长度
+    """
+
+    def __init__(
+        self,
+        primary: cv2.VideoCapture,
+        secondary: cv2.VideoCapture,
+        mode: str = STREAM_SYNC_MODE,
+        threaded: bool = STREAM_DECODE_THREADS,
+        queue_size: int = STREAM_DECODE_QUEUE_SIZE,
+    ):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"不支持的同步方式: {mode}")
+        if threaded:
+            self.primary = ThreadedStreamClock(primary, mode, queue_size, name="primary-decoder")
+            self.secondary = ThreadedStreamClock(
+                secondary, mode, queue_size, name="secondary-decoder"
+            )
+        else:
+            self.primary = StreamClock(primary, mode)
+            self.secondary = StreamClock(secondary, mode)
+        self.threaded = threaded
+        self._secondary_frame: Optional[np.ndarray] = None
+        self._secondary_retrieved = -1
+        self._secondary_paired = -1
+        self._pairs = 0
+        self._secondary_skipped = 0
+        self._secondary_reused = 0
+        self._drift_sum = 0.0
+        self._drift_max = 0.0
+        self._drift_last = 0.0
+
+    def grab(self) -> bool:
+        """前进到下一对帧（只抓取），任一路结束时返回False"""
+        if not self.primary.grab():
+            return False
+        target = self.primary.timestamp
+
+        if self.secondary.timestamp is None and not self.secondary.grab():
+            return False
+        # 下一帧更接近主路时间戳时前进，按副路帧周期的一半判断
+        while self.secondary.timestamp < target - self.secondary.period / 2:
+            if self.secondary.index != self._secondary_paired:
+                self._secondary_skipped += 1
+            if not self.secondary.grab():
+                return False
+
+        if self.secondary.index == self._secondary_paired:
+            self._secondary_reused += 1
+        self._secondary_paired = self.secondary.index
+        drift = self.secondary.timestamp - target
+        self._pairs += 1
+        self._drift_sum += abs(drift)
+        self._drift_max = max(self._drift_max, abs(drift))
+        self._drift_last = drift
+        return True
+
+    def retrieve(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """将当前一对帧转换为图像，失败时返回None"""
+        ok, primary_frame = self.primary.retrieve()
+        if not ok:
+            return None
+        if self._secondary_retrieved != self.secondary.index:
+            ok, self._secondary_frame = self.secondary.retrieve()
+            if not ok:
+                return None
+            self._secondary_retrieved = self.secondary.index
+        return primary_frame, self._secondary_frame
+
+    def read(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """读取下一对帧，视频结束时返回None"""
+        if not self.grab():
+            return None
+        return self.retrieve()
+
+    def estimate_pairs(self) -> int:
+        """估算剩余帧对数：主路剩余帧数与副路剩余时长中较短的一方"""
+        primary_left = self.primary.frames_left()
+        secondary_left_ms = self.secondary.frames_left() * self.secondary.period
+        return max(int(min(primary_left, secondary_left_ms / self.primary.period)), 0)
+
+    def close(self) -> None:
+        """停止解码线程，释放视频捕获之前调用"""
+        self.primary.close()
+        self.secondary.close()
+
+    def stats(self) -> dict:
+        """配对统计，漂移为副路与主路时间戳之差（毫秒）"""
+        return {
+            "pairs": self._pairs,
+            "mode": "timestamp"
+            if self.primary.use_timestamps and self.secondary.use_timestamps
+            else "fps",
+            "primary_fps": self.primary.fps,
+            "secondary_fps": self.secondary.fps,
+            "secondary_skipped": self._secondary_skipped,
+            "secondary_reused": self._secondary_reused,
+            "drift_last_ms": self._drift_last,
+            "drift_mean_ms": self._drift_sum / self._pairs if self._pairs else 0.0,
+            "drift_max_ms": self._drift_max,
+            "threaded": self.threaded,
+            "primary_decode_time": self.primary.decode_time,
+            "secondary_decode_time": self.secondary.decode_time,
+        }
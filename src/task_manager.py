@@ -1,8 +1,16 @@
+from abc import ABC, abstractmethod
+from collections import deque
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
 import time
 from src.config import (
     get_logger,
+    TASK_DB_PATH,
+    TASK_TTL_SECONDS,
 )
 
 
@@ -11,23 +19,311 @@ logger = get_logger()
 
 class TaskStatus(Enum):
     PENDING = "pending"  # 任务等待中
+    QUEUED = "queued"  # 任务在调度队列中排队
     PROCESSING = "processing"  # 任务处理中
     COMPLETED = "completed"  # 任务完成
     FAILED = "failed"  # 任务失败
+    CANCELLED = "cancelled"  # 任务已取消
 
 
-class TaskManager:
+# 已结束的任务状态，超过保留时间后会被清理
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
+
+
+class TaskCancelled(Exception):
+    """任务被取消时由执行中的任务抛出"""
+
+
+class TaskStore(ABC):
+    """任务存储接口，记录格式为 {"status", "result", "error", "start_time", "end_time", "progress"}"""
+
+    @abstractmethod
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        """新建任务记录，已存在时覆盖"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """返回任务记录的副本，任务不存在时返回None"""
+
+    @abstractmethod
+    def update(self, task_id: str, fields: Dict[str, Any], unfinished_only: bool = False) -> bool:
+        """更新任务字段，任务不存在时返回False
+
+        unfinished_only 为True时只在任务尚未结束时更新（检查和写入是原子的），
+        任务已结束时同样返回False。
+        """
+
+    @abstractmethod
+    def list(
+        self, offset: int = 0, limit: int = 50, status: Optional[TaskStatus] = None
+    ) -> Tuple[List[Tuple[str, Dict[str, Any]]], int]:
+        """按创建时间倒序分页列出任务，返回 (任务列表, 总数)"""
+
+    @abstractmethod
+    def evict_finished(self, before: float) -> int:
+        """删除在 before 之前结束的任务，返回删除数量"""
+
+    @abstractmethod
+    def fail_unfinished(self, error: str, end_time: float) -> int:
+        """将所有未结束的任务标记为失败，返回更新数量"""
+
+
+class MemoryTaskStore(TaskStore):
+    """基于字典的内存任务存储，重启后数据丢失"""
+
     def __init__(self):
-        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
 
-    def create_task(self, task_id: str) -> None:
-        self.tasks[task_id] = {
-            "status": TaskStatus.PENDING,
-            "result": None,
-            "error": None,
-            "start_time": time.time(),
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._tasks[task_id] = dict(record)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id: str, fields: Dict[str, Any], unfinished_only: bool = False) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or (unfinished_only and task["status"] in FINISHED_STATUSES):
+                return False
+            task.update(fields)
+            return True
+
+    def list(self, offset=0, limit=50, status=None):
+        with self._lock:
+            items = [
+                (task_id, dict(task))
+                for task_id, task in self._tasks.items()
+                if status is None or task["status"] == status
+            ]
+        items.sort(key=lambda item: item[1]["start_time"], reverse=True)
+        return items[offset : offset + limit], len(items)
+
+    def evict_finished(self, before: float) -> int:
+        with self._lock:
+            expired = [
+                task_id
+                for task_id, task in self._tasks.items()
+                if task["status"] in FINISHED_STATUSES
+                and (task.get("end_time") or task["start_time"]) < before
+            ]
+            for task_id in expired:
+                del self._tasks[task_id]
+        return len(expired)
+
+    def fail_unfinished(self, error: str, end_time: float) -> int:
+        with self._lock:
+            unfinished = [
+                task for task in self._tasks.values() if task["status"] not in FINISHED_STATUSES
+            ]
+            for task in unfinished:
+                task.update(status=TaskStatus.FAILED, error=error, end_time=end_time)
+        return len(unfinished)
+
+
+class SQLiteTaskStore(TaskStore):
+    """基于SQLite的持久化任务存储
+
+    结果以JSON保存在数据库中，按任务ID和状态建立索引。每个进程使用独立连接，
+    进程内通过锁串行访问。
+    """
+
+    _COLUMNS = ("status", "result", "error", "start_time", "end_time", "progress")
+    _SELECT = ", ".join(_COLUMNS)
+
+    def __init__(self, db_path: str = TASK_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        with self._lock:
+            self._connect().executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    start_time REAL NOT NULL,
+                    end_time REAL,
+                    progress TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+                CREATE INDEX IF NOT EXISTS idx_tasks_start_time ON tasks (start_time);
+                CREATE INDEX IF NOT EXISTS idx_tasks_end_time ON tasks (end_time);
+                """
+            )
+            # 兼容没有progress列的旧数据库
+            columns = {row[1] for row in self._connect().execute("PRAGMA table_info(tasks)")}
+            if "progress" not in columns:
+                self._connect().execute("ALTER TABLE tasks ADD COLUMN progress TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork出的子进程不能复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.db_path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _encode(field: str, value: Any) -> Any:
+        if field == "status":
+            return value.value
+        if field in ("result", "progress"):
+            return json.dumps(value, ensure_ascii=False, default=str) if value is not None else None
+        return value
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        status, result, error, start_time, end_time, progress = row
+        return {
+            "status": TaskStatus(status),
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "start_time": start_time,
+            "end_time": end_time,
+            "progress": json.loads(progress) if progress is not None else None,
         }
+
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        values = [self._encode(c, record.get(c)) for c in self._COLUMNS]
+        with self._lock:
+            self._connect().execute(
+                f"INSERT OR REPLACE INTO tasks (task_id, {self._SELECT}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [task_id, *values],
+            )
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {self._SELECT} FROM tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def update(self, task_id: str, fields: Dict[str, Any], unfinished_only: bool = False) -> bool:
+        fields = {k: v for k, v in fields.items() if k in self._COLUMNS}
+        if not fields:
+            task = self.get(task_id)
+            return task is not None and not (
+                unfinished_only and task["status"] in FINISHED_STATUSES
+            )
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        params = [*(self._encode(k, v) for k, v in fields.items()), task_id]
+        where = "task_id = ?"
+        if unfinished_only:
+            where += f" AND status NOT IN ({', '.join('?' for _ in FINISHED_STATUSES)})"
+            params.extend(s.value for s in FINISHED_STATUSES)
+        with self._lock:
+            cursor = self._connect().execute(f"UPDATE tasks SET {assignments} WHERE {where}", params)
+        return cursor.rowcount > 0
+
+    def list(self, offset=0, limit=50, status=None):
+        where, params = ("WHERE status = ?", [status.value]) if status else ("", [])
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT task_id, {self._SELECT} FROM tasks {where} "
+                "ORDER BY start_time DESC LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        return [(row[0], self._decode(row[1:])) for row in rows], total
+
+    def evict_finished(self, before: float) -> int:
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock:
+            cursor = self._connect().execute(
+                f"DELETE FROM tasks WHERE status IN ({placeholders}) AND end_time < ?",
+                [*(s.value for s in FINISHED_STATUSES), before],
+            )
+        return cursor.rowcount
+
+    def fail_unfinished(self, error: str, end_time: float) -> int:
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock:
+            cursor = self._connect().execute(
+                f"UPDATE tasks SET status = ?, error = ?, end_time = ? "
+                f"WHERE status NOT IN ({placeholders})",
+                [
+                    TaskStatus.FAILED.value,
+                    error,
+                    end_time,
+                    *(s.value for s in FINISHED_STATUSES),
+                ],
+            )
+        return cursor.rowcount
+
+
+class ProgressTracker:
+    """统计视频类任务的处理进度并定期写入任务存储
+
+    帧率按最近 window 秒内的处理帧数滑动计算，写入间隔不小于 interval 秒。
+    """
+
+    def __init__(self, task_id: str, interval: float = 0.5, window: float = 5.0):
+        self.task_id = task_id
+        self.interval = interval
+        self.window = window
+        self._samples: deque = deque()
+        self._last_report = 0.0
+
+    def __call__(self, frames_done: int, total_frames: int) -> None:
+        now = time.monotonic()
+        self._samples.append((now, frames_done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+        finished = total_frames > 0 and frames_done >= total_frames
+        if now - self._last_report < self.interval and not finished:
+            return
+        self._last_report = now
+
+        start_time, start_frames = self._samples[0]
+        elapsed = now - start_time
+        fps = (frames_done - start_frames) / elapsed if elapsed > 0 else 0.0
+        remaining = max(total_frames - frames_done, 0)
+        task_manager.update_progress(
+            self.task_id,
+            {
+                "frames_done": frames_done,
+                "total_frames": total_frames,
+                "percent": round(100.0 * frames_done / total_frames, 2) if total_frames > 0 else None,
+                "fps": round(fps, 2),
+                "eta_seconds": round(remaining / fps, 1) if fps > 0 and total_frames > 0 else None,
+            },
+        )
+
+
+class TaskManager:
+    def __init__(self, store: Optional[TaskStore] = None, ttl: float = TASK_TTL_SECONDS):
+        self.store = store if store is not None else SQLiteTaskStore()
+        self.ttl = ttl
+        self._last_eviction = 0.0
+
+    def create_task(self, task_id: str) -> None:
+        self.store.create(
+            task_id,
+            {
+                "status": TaskStatus.PENDING,
+                "result": None,
+                "error": None,
+                "start_time": time.time(),
+                "end_time": None,
+                "progress": None,
+            },
+        )
         logger.info(f"Task created: {task_id}")
+        self._maybe_evict()
 
     def update_task(
         self,
@@ -35,20 +331,41 @@ class TaskManager:
         status: TaskStatus,
         result=None,
         error=None,
-    ) -> None:
-        if task_id in self.tasks:
-            if status:
-                self.tasks[task_id]["status"] = status
-            if result is not None:
-                self.tasks[task_id]["result"] = result
-            if error is not None:
-                self.tasks[task_id]["error"] = error
+    ) -> bool:
+        """更新任务状态、结果或错误信息
+
+        已结束（完成、失败、取消）的任务不再接受更新，避免取消被执行中的任务
+        覆盖为完成或失败，或已完成的任务被改为取消。
+
+        Returns:
+            bool: 是否已更新，任务不存在或已结束时返回False
+        """
+        fields: Dict[str, Any] = {}
+        if status:
+            fields["status"] = status
+            if status in FINISHED_STATUSES:
+                fields["end_time"] = time.time()
+        if result is not None:
+            fields["result"] = result
+        if error is not None:
+            fields["error"] = error
+
+        if self.store.update(task_id, fields, unfinished_only=True):
             logger.info(f"Task updated: {task_id}, status: {status.value}")
-        else:
+            return True
+
+        task = self.store.get(task_id)
+        if task is None:
             logger.error(f"Task not found: {task_id}")
+        else:
+            logger.info(
+                f"Task already {task['status'].value}, ignoring update: {task_id}, "
+                f"status: {status.value}"
+            )
+        return False
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        task = self.tasks.get(task_id)
+        task = self.store.get(task_id)
         if task:
             logger.info(
                 f"Getting task status: {task_id}, status: {task['status'].value}"
@@ -57,5 +374,39 @@ class TaskManager:
             logger.warning(f"Task not found when getting status: {task_id}")
         return task
 
+    def update_progress(self, task_id: str, progress: Dict[str, Any]) -> None:
+        """更新任务进度，调用频繁，不记录日志"""
+        self.store.update(task_id, {"progress": progress})
+
+    def list_tasks(
+        self, offset: int = 0, limit: int = 50, status: Optional[TaskStatus] = None
+    ) -> Tuple[List[Tuple[str, Dict[str, Any]]], int]:
+        return self.store.list(offset=offset, limit=limit, status=status)
+
+    def evict_expired(self) -> int:
+        """清理超过保留时间的已结束任务"""
+        removed = self.store.evict_finished(time.time() - self.ttl)
+        if removed:
+            logger.info(f"Evicted {removed} expired tasks")
+        return removed
+
+    def recover_interrupted(self) -> int:
+        """将上次运行遗留的未结束任务标记为失败
+
+        只应在主进程启动时调用一次：这些任务的执行线程已随进程退出，状态不会再变化，
+        不标记为结束的话既不会被清理，也会让 /task/events 一直等待。
+        """
+        count = self.store.fail_unfinished("Interrupted by restart", time.time())
+        if count:
+            logger.warning(f"Marked {count} interrupted tasks as failed")
+        return count
+
+    def _maybe_evict(self) -> None:
+        # 最多每分钟清理一次，避免每次创建任务都扫描
+        now = time.time()
+        if now - self._last_eviction >= 60:
+            self._last_eviction = now
+            self.evict_expired()
+
 
 task_manager = TaskManager()
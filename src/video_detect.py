@@ -1,21 +1,207 @@
 import cv2
-from ultralytics import YOLO
-from config import ROOT, DETECT_FOLDER
+import numpy as np
+from config import (
+    ROOT,
+    DETECT_FOLDER,
+    DETECTIONS_FORMAT,
+    DETECT_VIDEO_MAX_BATCH,
+    DETECT_VIDEO_MAX_PENDING,
+    DETECT_VIDEO_MAX_STRIDE,
+)
+from src.dehaze.engine import get_dehaze_engine
+from src.dehaze.temporal import TemporalDehazer
+from src.detection_log import DetectionWriter, detections_path
+from src.image_detect import draw_detections, to_detections
+from src.model_registry import model_registry
+from src.video_io import AsyncVideoWriter, ThreadedBatchMap, ThreadedFrameReader
 from pathlib import Path
+from typing import Callable, Optional
 import time
 
 
+def _read_frames(cap: cv2.VideoCapture, stage_times: dict):
+    """在当前线程中顺序解码视频帧"""
+    while cap.isOpened():
+        start = time.perf_counter()
+        ret, frame = cap.read()
+        stage_times["decode"] += time.perf_counter() - start
+        if not ret:
+            break
+        yield frame
+
+
+def _dehaze_frames(frames, engine, batch_size: int, stage_times: dict):
+    """在当前线程中按批去雾"""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            start = time.perf_counter()
+            yield from engine.dehaze_frames(batch)
+            stage_times["dehaze"] += time.perf_counter() - start
+            batch = []
+    if batch:
+        start = time.perf_counter()
+        yield from engine.dehaze_frames(batch)
+        stage_times["dehaze"] += time.perf_counter() - start
+
+
+def _iou(a: list, b: list) -> float:
+    """计算两个框的交并比"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def interpolate_detections(
+    prev: list, next_: list, t: float, iou_thres: float = 0.3
+) -> list:
+    """在两个关键帧的检测结果之间插值
+
+    按交并比贪心匹配前后关键帧的检测框，匹配上的框做线性插值；
+    未匹配的框在前半段沿用前一关键帧，后半段采用后一关键帧。
+
+    Args:
+        prev (list): 前一关键帧的检测结果
+        next_ (list): 后一关键帧的检测结果
+        t (float): 当前帧在两个关键帧之间的位置，取值 [0, 1]
+        iou_thres (float): 匹配所需的最小交并比
+
+    Returns:
+        list: 插值得到的检测结果
+    """
+    pairs = sorted(
+        (
+            (_iou(p["bbox"], n["bbox"]), i, j)
+            for i, p in enumerate(prev)
+            for j, n in enumerate(next_)
+        ),
+        reverse=True,
+    )
+    matched_prev, matched_next = set(), set()
+    detections = []
+    for iou, i, j in pairs:
+        if iou < iou_thres:
+            break
+        if i in matched_prev or j in matched_next:
+            continue
+        matched_prev.add(i)
+        matched_next.add(j)
+        p, n = prev[i], next_[j]
+        detections.append(
+            {
+                "bbox": [
+                    int(round(a + (b - a) * t)) for a, b in zip(p["bbox"], n["bbox"])
+                ],
+                "confidence": p["confidence"] + (n["confidence"] - p["confidence"]) * t,
+                "label": p["label"],
+            }
+        )
+
+    unmatched = (
+        [p for i, p in enumerate(prev) if i not in matched_prev]
+        if t < 0.5
+        else [n for j, n in enumerate(next_) if j not in matched_next]
+    )
+    return detections + [dict(det) for det in unmatched]
+
+
+class _KeyframeSelector:
+    """决定哪些帧需要运行检测
+
+    stride 模式下每 stride 帧检测一次；keyframe_only 模式下仅在场景变化
+    （缩略灰度图与上一检测帧的平均差异超过阈值）时检测，stride 作为两次
+    检测之间的最大间隔。
+    """
+
+    def __init__(self, stride: int, keyframe_only: bool, scene_threshold: float):
+        self.stride = stride
+        self.keyframe_only = keyframe_only
+        self.scene_threshold = scene_threshold
+        self._last_key_index = None
+        self._last_thumb = None
+
+    def __call__(self, index: int, frame: np.ndarray) -> bool:
+        if self._last_key_index is None:
+            is_key = True
+        elif index - self._last_key_index >= self.stride:
+            is_key = True
+        elif self.keyframe_only:
+            thumb = self._thumbnail(frame)
+            is_key = (
+                float(cv2.absdiff(thumb, self._last_thumb).mean()) > self.scene_threshold
+            )
+        else:
+            is_key = False
+
+        if is_key:
+            self.force(index, frame)
+        return is_key
+
+    def force(self, index: int, frame: np.ndarray) -> bool:
+        """将指定帧记为关键帧"""
+        self._last_key_index = index
+        if self.keyframe_only:
+            self._last_thumb = self._thumbnail(frame)
+        return True
+
+    @staticmethod
+    def _thumbnail(frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA)
+
+
 def detect_video(
     video_path: str,
     model_path: str = "yolo11n.pt",
     save_folder: Path = Path(DETECT_FOLDER),
-) -> tuple[str, float]:
+    pipelined: bool = True,
+    queue_size: int = 8,
+    batch_size: int = 1,
+    stride: int = 1,
+    keyframe_only: bool = False,
+    scene_threshold: float = 8.0,
+    dehaze: bool = False,
+    dehaze_temporal: bool = False,
+    detections_format: Optional[str] = DETECTIONS_FORMAT,
+    run_id: Optional[str] = None,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> tuple[str, float, dict]:
     """检测视频中的目标
 
+    流水线模式下解码、推理、绘制编码分别在解码线程、当前线程和编码线程中执行，
+    各阶段之间通过有界队列连接，帧顺序保持不变。batch_size 大于1时，
+    每次收集 batch_size 个待检测帧进行一次批量推理。
+
+    stride 大于1或开启 keyframe_only 时只对部分帧运行检测，其余帧的检测框
+    由前后关键帧插值得到，输出视频和检测时间线仍覆盖每一帧。等待写出的帧
+    达到 DETECT_VIDEO_MAX_PENDING 时强制把当前帧作为关键帧，以限制内存。
+
+    dehaze 为True时在解码和检测之间插入去雾阶段，帧在内存中传递，
+    输出视频为去雾后的画面。
+
+    每帧的检测结果在处理过程中写入输出目录下以 run_id 命名的文件（JSONL 或列式），
+    路径见返回的 stats["detections_path"]，可用 src.detection_log.read_detections 按范围读取。
+
     Args:
         video_path (str): 输入视频路径
         model_path (str): 模型路径
         save_folder (Path): 输出目录
+        pipelined (bool): 是否使用解码→推理→编码流水线
+        queue_size (int): 流水线各阶段之间的队列长度
+        batch_size (int): 每次推理的帧数，不超过 DETECT_VIDEO_MAX_BATCH
+        stride (int): 每隔多少帧检测一次（keyframe_only 时为最大检测间隔），不超过 DETECT_VIDEO_MAX_STRIDE
+        keyframe_only (bool): 是否只在场景变化的关键帧上检测
+        scene_threshold (float): 判定场景变化的缩略图平均像素差阈值
+        dehaze (bool): 是否先去雾再检测
+        dehaze_temporal (bool): 去雾时是否在相邻帧之间复用全局统计量
+        detections_format (str): 检测结果文件格式，"jsonl"、"columnar"，None 时不写出
+        run_id (str): 检测结果文件名使用的任务ID，None 时生成随机ID
+        cancel_check (Callable): 每批处理前调用，任务被取消时应抛出异常以中止处理
+        progress_callback (Callable): 每批写出后调用，参数为已处理帧数和总帧数
 
     Raises:
         ValueError: 无法读取视频文件
@@ -23,18 +209,23 @@ def detect_video(
     Returns:
         str: 输出视频路径
         float: 检测总耗时
-        list: 检测结果列表，包含每帧的检测信息
+        dict: 处理统计信息，包含帧数、平均帧率和各阶段耗时
     """
     start_time = time.time()
+    batch_size = min(max(1, int(batch_size)), DETECT_VIDEO_MAX_BATCH)
+    stride = min(max(1, int(stride)), DETECT_VIDEO_MAX_STRIDE)
+    is_keyframe = _KeyframeSelector(stride, keyframe_only, scene_threshold)
     cap = cv2.VideoCapture(video_path)
 
     if not cap.isOpened():
         raise ValueError("无法读取视频文件")
 
     # 获取视频基本信息
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    # 保留小数帧率（如29.97），检测结果的时间戳按它计算
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
     # 创建输出视频写入器
     filename = Path(video_path).name.replace(".mp4", "_detected.mp4")
@@ -44,81 +235,183 @@ def detect_video(
     fourcc = cv2.VideoWriter_fourcc(*"avc1")
     out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
 
-    # 加载模型
-    model = YOLO(model_path)
+    stage_times = {"decode": 0.0, "infer": 0.0, "encode": 0.0}
+    dehaze_engine = None
+    if dehaze:
+        stage_times["dehaze"] = 0.0
+        dehaze_engine = (
+            TemporalDehazer(get_dehaze_engine()) if dehaze_temporal else get_dehaze_engine()
+        )
+    dehazer = None
+    if pipelined:
+        reader = ThreadedFrameReader(cap, queue_size=max(queue_size, batch_size))
+        frames = iter(reader)
+        if dehaze:
+            dehazer = ThreadedBatchMap(
+                reader,
+                dehaze_engine.dehaze_frames,
+                batch_size=batch_size,
+                queue_size=max(queue_size, batch_size),
+                name="dehaze-stage",
+            )
+            frames = iter(dehazer)
+        writer = AsyncVideoWriter(
+            out, render=lambda item: draw_detections(*item), queue_size=queue_size
+        )
+    else:
+        reader = None
+        frames = _read_frames(cap, stage_times)
+        if dehaze:
+            frames = _dehaze_frames(frames, dehaze_engine, batch_size, stage_times)
+        writer = None
 
-    # 存储检测结果
-    detection_results = []
+    # 逐帧写出检测结果
+    detection_writer = None
+    if detections_format:
+        detection_writer = DetectionWriter(
+            detections_path(str(save_folder), run_id, detections_format), detections_format
+        )
     frame_count = 0
+    detected_count = 0
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    # 等待写出的帧: [帧, 是否关键帧, 检测结果]
+    pending = []
+    # 最近一个已写出的关键帧: (帧序号, 检测结果)
+    prev_key = None
+
+    def emit(frame: np.ndarray, frame_detections: list, is_key: bool) -> None:
+        nonlocal frame_count
 
         # 获取当前帧的时间戳
         timestamp = frame_count / fps
 
-        # 对当前帧进行目标检测
-        results = model(frame, conf=0.5, classes=[0], verbose=False)[0]
+        # 写出检测结果
+        if detection_writer is not None:
+            detection_writer.write(frame_count, timestamp, frame_detections, is_key)
 
-        # 在帧上绘制检测框
-        annotated_frame = frame.copy()
-        frame_detections = []
+        # 绘制检测框并写入处理后的帧
+        if writer is not None:
+            writer.write((frame, frame_detections))
+        else:
+            start = time.perf_counter()
+            out.write(draw_detections(frame, frame_detections))
+            stage_times["encode"] += time.perf_counter() - start
+        frame_count += 1
 
-        for box in results.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
+    def flush(final: bool) -> None:
+        nonlocal pending, prev_key, detected_count
 
-            # 存储检测结果
-            frame_detections.append(
-                {"bbox": [x1, y1, x2, y2], "confidence": conf, "label": "Person"}
-            )
+        if cancel_check is not None:
+            cancel_check()
 
-            # 绘制边界框
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            # 添加标签
-            label = f"Person {conf:.2f}"
-            cv2.putText(
-                annotated_frame,
-                label,
-                (x1, y1 - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 0),
-                2,
-            )
+        # 对尚未检测的关键帧进行一次批量检测
+        keys = [item for item in pending if item[1] and item[2] is None]
+        if keys:
+            start = time.perf_counter()
+            with model_registry.acquire(model_path) as model:
+                batch_results = model(
+                    [item[0] for item in keys], conf=0.5, classes=[0], verbose=False
+                )
+            for item, results in zip(keys, batch_results):
+                item[2] = to_detections(results)
+            stage_times["infer"] += time.perf_counter() - start
+            detected_count += len(keys)
 
-        # 将检测结果添加到列表中
-        if frame_detections:
-            detection_results.append(
-                {"timestamp": timestamp, "detections": frame_detections}
-            )
+        # 写出到最后一个关键帧为止的所有帧，之后的帧需等待下一个关键帧
+        key_positions = [i for i, item in enumerate(pending) if item[1]]
+        end = len(pending) if final else (key_positions[-1] + 1 if key_positions else 0)
+        base = frame_count
+        for pos in range(end):
+            frame, is_key, frame_detections = pending[pos]
+            index = base + pos
+            if is_key:
+                prev_key = (index, frame_detections)
+            else:
+                next_pos = next((k for k in key_positions if k > pos), None)
+                if next_pos is None:
+                    # 视频末尾没有后续关键帧，沿用前一关键帧的结果
+                    frame_detections = [dict(det) for det in prev_key[1]]
+                else:
+                    next_index = base + next_pos
+                    t = (index - prev_key[0]) / (next_index - prev_key[0])
+                    frame_detections = interpolate_detections(
+                        prev_key[1], pending[next_pos][2], t
+                    )
+            emit(frame, frame_detections, is_key)
+        pending = pending[end:]
 
-        # 写入处理后的帧
-        out.write(annotated_frame)
-        frame_count += 1
+        if progress_callback is not None and end > 0:
+            progress_callback(frame_count, max(total_frames, frame_count))
 
-    # 释放资源
-    cap.release()
-    out.release()
+    try:
+        key_count = 0
+        for index, frame in enumerate(frames):
+            is_key = is_keyframe(index, frame)
+            if not is_key and len(pending) + 1 >= DETECT_VIDEO_MAX_PENDING:
+                # 非关键帧要等到下一个关键帧才能插值写出，积压过多时提前检测
+                is_key = is_keyframe.force(index, frame)
+            pending.append([frame, is_key, None])
+            if is_key:
+                key_count += 1
+                if key_count >= batch_size or len(pending) >= DETECT_VIDEO_MAX_PENDING:
+                    flush(final=False)
+                    key_count = 0
+        flush(final=True)
+    finally:
+        # 释放资源，先停止消费解码队列的去雾阶段
+        if dehazer is not None:
+            dehazer.close()
+            stage_times["dehaze"] = dehazer.elapsed
+        if reader is not None:
+            reader.close()
+            stage_times["decode"] = reader.decode_time
+        if writer is not None:
+            writer.release()
+            stage_times["encode"] = writer.encode_time
+        else:
+            out.release()
+        cap.release()
+        if detection_writer is not None:
+            detection_writer.close()
 
     end_time = time.time()
     process_time = end_time - start_time
 
-    return output_path, process_time
+    stats = {
+        "frames": frame_count,
+        "fps": frame_count / process_time if process_time > 0 else 0.0,
+        "pipelined": pipelined,
+        "batch_size": batch_size,
+        "stride": stride,
+        "keyframe_only": keyframe_only,
+        "dehaze": dehaze,
+        # 实际运行检测的帧占比
+        "detection_rate": detected_count / frame_count if frame_count else 0.0,
+        # 纯推理吞吐量，用于调整批大小
+        "infer_fps": detected_count / stage_times["infer"] if stage_times["infer"] > 0 else 0.0,
+        "stage_times": stage_times,
+    }
+    if isinstance(dehaze_engine, TemporalDehazer):
+        stats["dehaze_temporal"] = dehaze_engine.stats()
+    if detection_writer is not None:
+        stats["detections_path"] = detection_writer.path
+        stats["detections_format"] = detection_writer.format
+        stats["detected_frames"] = detection_writer.frames
+        stats["detected_boxes"] = detection_writer.boxes
+
+    return output_path, process_time, stats
 
 
 if __name__ == "__main__":
     video_path = Path(ROOT) / "data" / "output_ir.mp4"
 
     try:
-        output_path, process_time, detections = detect_video(
+        output_path, process_time, stats = detect_video(
             str(video_path), model_path="yolo11n.pt", save_folder=Path(ROOT) / "results"
         )
         print(f"处理后的视频保存在: {output_path}")
         print(f"总处理时间: {process_time:.2f}秒")
-        print(f"检测到的目标数量: {len(detections)}")
+        print(f"处理帧数: {stats['frames']}, 平均帧率: {stats['fps']:.2f}, 推理帧率: {stats['infer_fps']:.2f}")
+        print(f"各阶段耗时: {stats['stage_times']}")
     except Exception as e:
         print(f"处理失败: {str(e)}")
@@ -0,0 +1,241 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+# 队列结束标记
+_END = object()
+
+
+def open_video_writer(
+    path: str, fps: float, size: Tuple[int, int], codecs: Sequence[str]
+) -> Tuple[cv2.VideoWriter, str]:
+    """按顺序尝试编码器创建视频写入器，返回第一个能打开的写入器及其编码
+
+    Raises:
+        ValueError: 所有编码器都无法打开
+    """
+    for codec in codecs:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        if writer.isOpened():
+            return writer, codec
+        writer.release()
+    raise ValueError(f"无法创建视频写入器，尝试过的编码: {', '.join(codecs)}")
+
+
+class ThreadedFrameReader:
+    """在独立线程中解码视频帧，通过有界队列按顺序输出
+
+    Args:
+        cap: 已打开的视频捕获
+        queue_size: 队列长度
+        read: 读取函数，返回 (是否成功, 输出项)，默认为 cap.read
+        name: 线程名称
+    """
+
+    def __init__(
+        self,
+        cap: cv2.VideoCapture,
+        queue_size: int = 8,
+        read: Optional[Callable[[], Tuple[bool, Any]]] = None,
+        name: str = "frame-reader",
+    ):
+        self.cap = cap
+        self.read = read or cap.read
+        self.decode_time = 0.0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        # 队列满时周期性检查停止标记，避免消费者退出后线程永久阻塞
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                ret, frame = self.read()
+                self.decode_time += time.perf_counter() - start
+                if not ret:
+                    break
+                if not self._put(frame):
+                    return
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class AsyncVideoWriter:
+    """在独立线程中渲染并编码视频帧，通过有界队列接收待写入的帧
+
+    Args:
+        writer: 已打开的 cv2.VideoWriter
+        render: 在编码线程中执行的渲染函数，将提交的数据转换为待写入的帧
+        queue_size: 队列长度，队列满时 write 阻塞以限制内存
+    """
+
+    def __init__(
+        self,
+        writer: cv2.VideoWriter,
+        render: Optional[Callable[[Any], np.ndarray]] = None,
+        queue_size: int = 8,
+    ):
+        self.writer = writer
+        self.render = render
+        self.encode_time = 0.0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        # write_copy 使用的帧缓冲区：队列中最多 queue_size 帧、编码线程持有1帧、调用方正在写入1帧
+        self._buffers: List[np.ndarray] = []
+        self._buffer_count = queue_size + 2
+        self._next_buffer = 0
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="video-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            if self._error is not None:
+                # 出错后继续消费队列，避免生产者阻塞
+                continue
+            try:
+                start = time.perf_counter()
+                frame = self.render(item) if self.render else item
+                self.writer.write(frame)
+                self.encode_time += time.perf_counter() - start
+            except BaseException as e:
+                self._error = e
+
+    def write(self, item: Any) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def write_copy(self, frame: np.ndarray) -> None:
+        """复制帧后提交，调用方之后可以继续复用自己的帧缓冲区
+
+        复制到轮换使用的预分配缓冲区中，缓冲区个数保证被覆盖时对应的帧已经写完。
+        """
+        if not self._buffers or self._buffers[0].shape != frame.shape:
+            self._buffers = [np.empty_like(frame) for _ in range(self._buffer_count)]
+            self._next_buffer = 0
+        buffer = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % self._buffer_count
+        np.copyto(buffer, frame)
+        self.write(buffer)
+
+    def release(self) -> None:
+        """等待队列中的帧全部写完并释放写入器"""
+        self._queue.put(_END)
+        self._thread.join()
+        self.writer.release()
+        if self._error is not None:
+            raise self._error
+
+
+class ThreadedBatchMap:
+    """在独立线程中对输入逐批执行 fn，通过有界队列按顺序输出结果
+
+    用于在解码和检测之间插入去雾等处理阶段：上游迭代器在本阶段线程中消费，
+    每凑够 batch_size 项调用一次 fn，输出队列满时阻塞以限制内存。
+
+    Args:
+        source: 输入迭代器
+        fn: 批处理函数，输入列表，按相同顺序返回等长的结果列表
+        batch_size: 每批项数
+        queue_size: 输出队列长度
+        name: 线程名称
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        fn: Callable[[List[Any]], List[Any]],
+        batch_size: int = 1,
+        queue_size: int = 8,
+        name: str = "frame-stage",
+    ):
+        self.source = source
+        self.fn = fn
+        self.batch_size = max(1, batch_size)
+        self.elapsed = 0.0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(queue_size, self.batch_size))
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _process(self, batch: List[Any]) -> bool:
+        start = time.perf_counter()
+        results = self.fn(batch)
+        self.elapsed += time.perf_counter() - start
+        return all(self._put(result) for result in results)
+
+    def _run(self) -> None:
+        try:
+            batch = []
+            for item in self.source:
+                if self._stop.is_set():
+                    return
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not self._process(batch):
+                        return
+                    batch = []
+            if batch:
+                self._process(batch)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
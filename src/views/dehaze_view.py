@@ -1,12 +1,26 @@
 import os
-from pathlib import Path
+import time
+import uuid
 
-from flask import Blueprint, jsonify, request
-import torch
+from flask import Blueprint, Response, jsonify, request
 
-import src.dehaze.model as net
-from src.config import DEHAZE_FOLDER, IMAGE_FOLDER, MODEL_FOLDER
-from src.dehaze.dehaze import dehaze_image
+from src.config import DEHAZE_FOLDER, VIDEO_FOLDER, get_logger
+from src.dehaze.dehaze import dehaze_images
+from src.dehaze.engine import get_dehaze_engine
+from src.image_io import (
+    decode_image,
+    encode_jpeg,
+    find_upload_image,
+    json_flag,
+    request_flag,
+    request_image_bytes,
+    to_base64,
+)
+from src.process_pool import dehaze_video_job, execution_backend
+from src.scheduler import JobPriority, QueueFullError, job_scheduler
+from src.task_manager import TaskCancelled, TaskStatus, task_manager
+
+logger = get_logger()
 
 dehaze_bp = Blueprint("dehaze", __name__, url_prefix="/")
 
@@ -14,11 +28,6 @@ dehaze_bp = Blueprint("dehaze", __name__, url_prefix="/")
 # 确保去雾后的图片保存目录存在
 os.makedirs(DEHAZE_FOLDER, exist_ok=True)
 
-# 初始化模型
-dev = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-dehaze_net = net.dehaze_net().to(dev)
-dehaze_net.load_state_dict(torch.load(Path(MODEL_FOLDER) / "dehaze.pth", weights_only=True))
-
 
 @dehaze_bp.route("/dehaze", methods=["POST"])
 def dehaze():
@@ -31,29 +40,195 @@ def dehaze():
         return jsonify({"error": "No image ID provided"}), 400
 
     # 在上传目录中查找图片
-    for ext in [".jpg", ".jpeg", ".png", ".bmp"]:
-        image_name = f"{image_id}{ext}"
-        image_path = os.path.join(IMAGE_FOLDER, image_name)
+    image_name, image_path = find_upload_image(image_id)
+    if image_path is None:
+        return jsonify({"error": "Image not found"}), 404
+
+    image_type = os.path.basename(os.path.normpath(DEHAZE_FOLDER))
+    try:
+        # 执行去雾处理
+        filenames, stats = dehaze_images(
+            image_paths=[image_path],
+            dehaze_net=get_dehaze_engine(),
+            save_path=DEHAZE_FOLDER,
+        )
+
+        return jsonify(
+            {
+                "code": 200,
+                "message": "Dehaze success",
+                "image_name": image_name,
+                "process_time": stats["latency_ms"] / 1000,
+                "file_path": f"/upload/{image_type}/{filenames[0]}",
+                "stats": stats["batches"][0] if stats["batches"] else {"cached": True},
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+
+@dehaze_bp.route("/dehaze/batch", methods=["POST"])
+def dehaze_batch():
+    """
+    批量图像去雾接口，相同尺寸的图片合并为一个批次推理
+
+    请求参数:
+    - image_ids: 图片ID列表
+    """
+    image_ids = request.json.get("image_ids")
+    if not image_ids or not isinstance(image_ids, list):
+        return jsonify({"error": "No image IDs provided"}), 400
+
+    found = [(image_id, *find_upload_image(image_id)) for image_id in image_ids]
+    missing = [image_id for image_id, _, image_path in found if image_path is None]
+    if missing:
+        return jsonify({"error": "Image not found", "image_ids": missing}), 404
+
+    image_type = os.path.basename(os.path.normpath(DEHAZE_FOLDER))
+    try:
+        filenames, stats = dehaze_images(
+            image_paths=[image_path for _, _, image_path in found],
+            dehaze_net=get_dehaze_engine(),
+            save_path=DEHAZE_FOLDER,
+        )
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+    return jsonify(
+        {
+            "code": 200,
+            "message": "Dehaze success",
+            "results": [
+                {
+                    "image_id": image_id,
+                    "image_name": image_name,
+                    "file_path": f"/upload/{image_type}/{filename}",
+                }
+                for (image_id, image_name, _), filename in zip(found, filenames)
+            ],
+            "process_time": stats["latency_ms"] / 1000,
+            "stats": stats["batches"],
+            "cached": stats["cached"],
+        }
+    )
+
+
+@dehaze_bp.route("/dehaze/bytes", methods=["POST"])
+def dehaze_bytes():
+    """
+    图像去雾接口 - 直接提交图像数据，不经过上传目录
+
+    请求体: multipart 的 image 字段，或原始图像字节
+    查询参数:
+    - format: json（默认，去雾图像以base64返回）或 jpeg（响应体为去雾后的JPEG）
+    - save: 是否同时保存去雾图像到去雾目录，默认false
+    """
+    data = request_image_bytes(request)
+    if not data:
+        return jsonify({"error": "No image data provided"}), 400
+    try:
+        image = decode_image(data)
+    except ValueError:
+        return jsonify({"error": "Invalid image data"}), 400
+
+    start = time.time()
+    try:
+        dehazed = encode_jpeg(get_dehaze_engine().dehaze_frames([image])[0])
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+    process_time = time.time() - start
+
+    file_path = None
+    if request_flag(request, "save"):
+        image_name = f"{uuid.uuid4()}.jpg"
+        with open(os.path.join(DEHAZE_FOLDER, image_name), "wb") as f:
+            f.write(dehazed)
         image_type = os.path.basename(os.path.normpath(DEHAZE_FOLDER))
-        if os.path.exists(image_path):
-            try:
-                # 执行去雾处理
-                filename, process_time = dehaze_image(
-                    image_path=image_path,
-                    dehaze_net=dehaze_net,
-                    save_path=DEHAZE_FOLDER,
-                )
+        file_path = f"/upload/{image_type}/{image_name}"
+
+    if request.args.get("format") == "jpeg":
+        headers = {"X-Process-Time": f"{process_time:.4f}"}
+        if file_path:
+            headers["X-File-Path"] = file_path
+        return Response(dehazed, mimetype="image/jpeg", headers=headers)
+
+    result = {
+        "code": 200,
+        "message": "Dehaze success",
+        "image": to_base64(dehazed),
+        "process_time": process_time,
+    }
+    if file_path:
+        result["file_path"] = file_path
+    return jsonify(result)
+
 
-                return jsonify(
-                    {
-                        "code": 200,
-                        "message": "Dehaze success",
-                        "image_name": image_name,
-                        "process_time": process_time,
-                        "file_path": f"/upload/{image_type}/{filename}",
-                    }
+def process_dehaze_video_in_background(task_id: str, video_path: str, options: dict):
+    """后台视频去雾"""
+    try:
+        task_manager.update_task(task_id, TaskStatus.PROCESSING)
+        output_path, process_time, stats = execution_backend.run(
+            dehaze_video_job, task_id, video_path, options
+        )
+        video_type = os.path.basename(os.path.normpath(DEHAZE_FOLDER))
+        video_name = os.path.basename(output_path)
+        task_manager.update_task(
+            task_id,
+            TaskStatus.COMPLETED,
+            result={
+                "message": "Dehaze success",
+                "save_path": output_path,
+                "process_time": process_time,
+                "file_path": f"/upload/{video_type}/{video_name}",
+                "stats": stats,
+            },
+        )
+        logger.info(f"Video dehaze completed: {output_path}")
+    except TaskCancelled:
+        # 由调度器记录取消，任务状态已是CANCELLED
+        raise
+    except Exception as e:
+        logger.error(f"Video dehaze failed: {str(e)}")
+        task_manager.update_task(task_id, TaskStatus.FAILED, error=str(e))
+
+
+@dehaze_bp.route("/dehaze/videos", methods=["POST"])
+def dehaze_videos():
+    """
+    视频去雾接口 - 异步处理
+
+    请求参数:
+    - video_id: 视频ID
+    - batch_size: 每次去雾推理的帧数，默认4
+    - temporal: 是否在相邻帧之间复用全局统计量，默认false
+    """
+    video_id = request.json.get("video_id")
+    if not video_id:
+        return jsonify({"error": "No video ID provided"}), 400
+
+    try:
+        options = {
+            "batch_size": int(request.json.get("batch_size", 4)),
+            "temporal": json_flag(request.json, "temporal", False),
+        }
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid dehaze options"}), 400
+
+    for ext in [".mp4", ".avi", ".mov"]:
+        video_path = os.path.join(VIDEO_FOLDER, f"{video_id}{ext}")
+        if os.path.exists(video_path):
+            task_id = str(uuid.uuid4())
+            try:
+                job_scheduler.submit(
+                    task_id,
+                    process_dehaze_video_in_background,
+                    args=(task_id, video_path, options),
+                    priority=JobPriority.NORMAL,
                 )
-            except Exception as e:
-                return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+            except QueueFullError:
+                return jsonify({"error": "Too many queued tasks, please retry later"}), 429, {
+                    "Retry-After": "10"
+                }
+            return jsonify({"message": "Processing started", "task_id": task_id})
 
-    return jsonify({"error": "Image not found"}), 404
+    return jsonify({"error": "Video not found"}), 404
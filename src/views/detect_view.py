@@ -1,13 +1,36 @@
+import json
 import os
+import time
 import uuid
-from threading import Thread
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from os.path import join, exists
-from src.config import IMAGE_FOLDER, DETECT_FOLDER, VIDEO_FOLDER, MERGE_FOLDER
-from src.image_detect import detect_and_draw
-from src.video_detect import detect_video
-from src.MultiModalVideoDetector import MultiModalVideoDetector
-from src.task_manager import task_manager, TaskStatus
+from src.config import (
+    DETECT_FOLDER,
+    VIDEO_FOLDER,
+    MERGE_FOLDER,
+    FUSION_STRATEGY,
+    STREAM_SYNC_MODE,
+    DETECTIONS_FORMAT,
+    DETECT_VIDEO_MAX_BATCH,
+    DETECT_VIDEO_MAX_STRIDE,
+)
+from src.detection_log import DETECTION_FORMATS
+from src.fusion import FUSION_STRATEGIES
+from src.stream_sync import SYNC_MODES
+from src.image_detect import array_batcher, draw_detections, image_batcher
+from src.image_io import (
+    decode_image,
+    encode_jpeg,
+    find_upload_image,
+    json_flag,
+    request_flag,
+    request_image_bytes,
+    to_base64,
+)
+from src.result_cache import result_cache
+from src.process_pool import detect_video_job, execution_backend, multimodal_detect_job
+from src.task_manager import TaskCancelled, TaskStatus, task_manager
+from src.scheduler import job_scheduler, JobPriority, QueueFullError
 from src.config import get_logger
 
 logger = get_logger()
@@ -15,6 +38,13 @@ logger = get_logger()
 detect_bp = Blueprint("detect", __name__, url_prefix="/detect")
 
 
+def _queue_full_response():
+    """调度队列已满时的429响应"""
+    return jsonify({"error": "Too many queued tasks, please retry later"}), 429, {
+        "Retry-After": "10"
+    }
+
+
 @detect_bp.route("/images", methods=["POST"])
 def detect_images_route():
     """
@@ -25,35 +55,169 @@ def detect_images_route():
     if not image_id:
         return jsonify({"error": "No image ID provided"}), 400
     # 在上传目录中查找图片
-    for ext in [".jpg", ".jpeg", ".png", ".bmp"]:
-        image_name = f"{image_id}{ext}"
-        image_path = join(IMAGE_FOLDER, image_name)
+    image_name, image_path = find_upload_image(image_id)
+    if image_path is None:
+        return jsonify({"error": "Image not found"}), 404
+
+    image_type = os.path.basename(os.path.normpath(DETECT_FOLDER))
+    try:
+        # 执行目标检测，与并发请求合并为同一批次推理
+        res = image_batcher.submit(image_path).result()
+
+        return jsonify(
+            {
+                "code": 200,
+                "message": "Detection success",
+                "save_path": res[0],
+                "process_time": res[1],
+                "file_path": f"/upload/{image_type}/{image_name}",
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+
+@detect_bp.route("/images/batch", methods=["POST"])
+def detect_images_batch_route():
+    """
+    批量图像检测
+
+    请求参数:
+    - image_ids: 图片ID列表
+
+    返回:
+    {
+        "code": 200,
+        "results": [{"image_id", "save_path", "process_time", "file_path"} | {"image_id", "error"}],
+        "process_time": 总耗时
+    }
+    """
+    image_ids = request.json.get("image_ids")
+    if not image_ids or not isinstance(image_ids, list):
+        return jsonify({"error": "No image IDs provided"}), 400
+
+    image_type = os.path.basename(os.path.normpath(DETECT_FOLDER))
+    start = time.time()
+
+    # 先全部提交，由微批处理器合并成批次
+    pending = []
+    for image_id in image_ids:
+        image_name, image_path = find_upload_image(image_id)
+        future = image_batcher.submit(image_path) if image_path else None
+        pending.append((image_id, image_name, future))
+
+    results = []
+    for image_id, image_name, future in pending:
+        if future is None:
+            results.append({"image_id": image_id, "error": "Image not found"})
+            continue
+        try:
+            save_path, process_time = future.result()
+            results.append(
+                {
+                    "image_id": image_id,
+                    "save_path": save_path,
+                    "process_time": process_time,
+                    "file_path": f"/upload/{image_type}/{image_name}",
+                }
+            )
+        except Exception as e:
+            results.append(
+                {"image_id": image_id, "error": f"Processing failed: {str(e)}"}
+            )
+
+    return jsonify(
+        {
+            "code": 200,
+            "message": "Detection success",
+            "results": results,
+            "process_time": time.time() - start,
+        }
+    )
+
+
+@detect_bp.route("/images/bytes", methods=["POST"])
+def detect_image_bytes_route():
+    """
+    图像检测 - 直接提交图像数据，不经过上传目录
+
+    请求体: multipart 的 image 字段，或原始图像字节
+    查询参数:
+    - format: json（默认，标注图像以base64返回）或 jpeg（响应体为标注后的JPEG，
+      检测结果在 X-Detections 响应头中）
+    - save: 是否同时保存标注图像到检测目录，默认false
+
+    返回:
+    {
+        "code": 200,
+        "detections": [{"bbox", "confidence", "label"}],
+        "image": 标注后的JPEG（base64）,
+        "process_time": 耗时,
+        "file_path": 保存路径（save=true时）
+    }
+    """
+    data = request_image_bytes(request)
+    if not data:
+        return jsonify({"error": "No image data provided"}), 400
+    try:
+        image = decode_image(data)
+    except ValueError:
+        return jsonify({"error": "Invalid image data"}), 400
+
+    start = time.time()
+    try:
+        # 与其他内存图像请求合并为同一批次推理
+        detections = array_batcher.submit(image).result()
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+    annotated = encode_jpeg(draw_detections(image, detections))
+    process_time = time.time() - start
+
+    file_path = None
+    if request_flag(request, "save"):
+        image_name = f"{uuid.uuid4()}.jpg"
+        with open(join(DETECT_FOLDER, image_name), "wb") as f:
+            f.write(annotated)
         image_type = os.path.basename(os.path.normpath(DETECT_FOLDER))
-        if exists(image_path):
-            try:
-                # 执行目标检测
-                res = detect_and_draw(image_path)
-
-                return jsonify(
-                    {
-                        "code": 200,
-                        "message": "Detection success",
-                        "save_path": res[0],
-                        "process_time": res[1],
-                        "file_path": f"/upload/{image_type}/{image_name}",
-                    }
-                )
-            except Exception as e:
-                return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+        file_path = f"/upload/{image_type}/{image_name}"
+
+    if request.args.get("format") == "jpeg":
+        headers = {
+            "X-Detections": json.dumps(detections),
+            "X-Process-Time": f"{process_time:.4f}",
+        }
+        if file_path:
+            headers["X-File-Path"] = file_path
+        return Response(annotated, mimetype="image/jpeg", headers=headers)
+
+    result = {
+        "code": 200,
+        "message": "Detection success",
+        "detections": detections,
+        "image": to_base64(annotated),
+        "process_time": process_time,
+    }
+    if file_path:
+        result["file_path"] = file_path
+    return jsonify(result)
 
-    return jsonify({"error": "Image not found"}), 404
 
+@detect_bp.route("/cache/stats", methods=["GET"])
+def cache_stats_route():
+    """推理结果缓存的命中统计（当前进程）"""
+    return jsonify(result_cache.stats())
 
-def process_single_video_in_background(task_id: str, video_path: str, video_id: str):
+
+def process_single_video_in_background(
+    task_id: str, video_path: str, video_id: str, options: dict
+):
     """后台处理单个视频的函数"""
     try:
         task_manager.update_task(task_id, TaskStatus.PROCESSING)
-        output_path, process_time = detect_video(video_path)
+        output_path, process_time, stats = execution_backend.run(
+            detect_video_job, task_id, video_path, options
+        )
         # 文件名
         video_name = os.path.basename(os.path.normpath(output_path))
         result = {
@@ -61,6 +225,7 @@ def process_single_video_in_background(task_id: str, video_path: str, video_id:
             "save_path": output_path,
             "process_time": process_time,
             "file_path": f"/upload/video/detected/{video_name}",
+            "stats": stats,
         }
 
         # 更新任务状态
@@ -70,6 +235,9 @@ def process_single_video_in_background(task_id: str, video_path: str, video_id:
             result=result,
         )
         logger.info(f"Video processing completed: {output_path}")
+    except TaskCancelled:
+        # 由调度器记录取消，任务状态已是CANCELLED
+        raise
     except Exception as e:
         logger.error(f"Video processing failed: {str(e)}")
         task_manager.update_task(task_id, TaskStatus.FAILED, error=str(e))
@@ -82,36 +250,68 @@ def detect_videos_route():
     if not video_id:
         return jsonify({"error": "No video ID provided"}), 400
 
+    # 处理选项
+    try:
+        options = {
+            "pipelined": json_flag(request.json, "pipelined", True),
+            "batch_size": int(request.json.get("batch_size", 1)),
+            "stride": int(request.json.get("stride", 1)),
+            "keyframe_only": json_flag(request.json, "keyframe_only", False),
+            "scene_threshold": float(request.json.get("scene_threshold", 8.0)),
+            "dehaze": json_flag(request.json, "dehaze", False),
+            "dehaze_temporal": json_flag(request.json, "dehaze_temporal", False),
+            "detections_format": request.json.get("detections_format", DETECTIONS_FORMAT),
+        }
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid detection options"}), 400
+    if not 1 <= options["batch_size"] <= DETECT_VIDEO_MAX_BATCH:
+        return jsonify(
+            {"error": f"batch_size must be between 1 and {DETECT_VIDEO_MAX_BATCH}"}
+        ), 400
+    if not 1 <= options["stride"] <= DETECT_VIDEO_MAX_STRIDE:
+        return jsonify(
+            {"error": f"stride must be between 1 and {DETECT_VIDEO_MAX_STRIDE}"}
+        ), 400
+    if options["detections_format"] not in (None, *DETECTION_FORMATS):
+        return jsonify({"error": "Invalid detections format"}), 400
+
     # 在上传目录中查找视频
     for ext in [".mp4", ".avi", ".mov"]:
         video_name = f"{video_id}{ext}"
         video_path = join(VIDEO_FOLDER, video_name)
         if exists(video_path):
             task_id = str(uuid.uuid4())
-            task_manager.create_task(task_id)
 
-            # 启动后台处理线程
-            thread = Thread(
-                target=process_single_video_in_background,
-                args=(task_id, video_path, video_id),  # 添加video_id参数
-                daemon=True,
-            )
-            thread.start()
+            # 提交到后台任务调度器
+            try:
+                job_scheduler.submit(
+                    task_id,
+                    process_single_video_in_background,
+                    args=(task_id, video_path, video_id, options),
+                    priority=JobPriority.NORMAL,
+                )
+            except QueueFullError:
+                return _queue_full_response()
 
             return jsonify({"message": "Processing started", "task_id": task_id})
 
     return jsonify({"error": "Video not found"}), 404
 
 
-def process_video_in_background(task_id: str, detector: MultiModalVideoDetector):
+def process_video_in_background(task_id: str, detector_kwargs: dict):
     try:
         task_manager.update_task(task_id, TaskStatus.PROCESSING)
-        detector.run()
+        output_path, stats = execution_backend.run(
+            multimodal_detect_job, task_id, detector_kwargs
+        )
         task_manager.update_task(
             task_id,
             TaskStatus.COMPLETED,
-            result={"message": "Detection success", "save_path": detector.output_path},
+            result={"message": "Detection success", "save_path": output_path, **stats},
         )
+    except TaskCancelled:
+        # 由调度器记录取消，任务状态已是CANCELLED
+        raise
     except Exception as e:
         task_manager.update_task(task_id, TaskStatus.FAILED, error=str(e))
 
@@ -122,28 +322,55 @@ def merge_and_detect():
     tr_path = request.args.get("tr_path")
     model_path = request.args.get("model_path")
     conf_thres = float(request.args.get("conf_thres", 0.5))
+    dehaze = request.args.get("dehaze", "false").lower() in ("1", "true")
+    dehaze_temporal = request.args.get("dehaze_temporal", "false").lower() in ("1", "true")
+    fusion = request.args.get("fusion", FUSION_STRATEGY)
+    if fusion not in FUSION_STRATEGIES:
+        return jsonify({"error": f"Unsupported fusion strategy: {fusion}"}), 400
+    sync_mode = request.args.get("sync", STREAM_SYNC_MODE)
+    if sync_mode not in SYNC_MODES:
+        return jsonify({"error": f"Unsupported sync mode: {sync_mode}"}), 400
+    # 输出编码（FourCC）和帧率，默认按 VIDEO_CODECS 回退、跟随IR源帧率
+    codec = request.args.get("codec")
+    if codec is not None and len(codec) != 4:
+        return jsonify({"error": "Codec must be a four-character code"}), 400
+    output_fps = request.args.get("fps", type=float)
+    if output_fps is not None and output_fps <= 0:
+        return jsonify({"error": "fps must be positive"}), 400
 
-    output_path = join(MERGE_FOLDER, "output_detection.mp4")
+    if not (ir_path and tr_path and exists(ir_path) and exists(tr_path)):
+        return jsonify({"error": "Video not found"}), 404
 
-    # 创建任务ID
+    # 创建任务ID，每个任务写入自己的输出文件
     task_id = str(uuid.uuid4())
-    task_manager.create_task(task_id)
+    output_path = join(MERGE_FOLDER, f"{task_id}.mp4")
 
-    # 初始化视频检测器
-    detector = MultiModalVideoDetector(
+    # 视频检测器在执行后端中创建，进程池后端下只传递可序列化的参数
+    detector_kwargs = dict(
         ir_params={"video_path": ir_path},
         tr_params={"video_path": tr_path},
         model_path=model_path,
         output_path=output_path,
         conf_thres=conf_thres,
         show_preview=False,
+        dehaze=dehaze,
+        dehaze_temporal=dehaze_temporal,
+        fusion=fusion,
+        sync_mode=sync_mode,
+        codec=codec,
+        output_fps=output_fps,
     )
 
-    # 启动后台处理线程
-    thread = Thread(
-        target=process_video_in_background, args=(task_id, detector), daemon=True
-    )
-    thread.start()
+    # 提交到后台任务调度器
+    try:
+        job_scheduler.submit(
+            task_id,
+            process_video_in_background,
+            args=(task_id, detector_kwargs),
+            priority=JobPriority.NORMAL,
+        )
+    except QueueFullError:
+        return _queue_full_response()
 
     # 立即返回任务ID
     return jsonify({"message": "Processing started", "task_id": task_id})
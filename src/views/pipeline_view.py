@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+
+import cv2
+from flask import Blueprint, jsonify, request
+
+from src.config import DEHAZE_FOLDER, DETECT_FOLDER, get_logger
+from src.dehaze.engine import get_dehaze_engine
+from src.image_detect import array_batcher, draw_detections
+from src.image_io import (
+    decode_image,
+    encode_jpeg,
+    find_upload_image,
+    request_flag,
+    request_image_bytes,
+    to_base64,
+)
+
+logger = get_logger()
+
+pipeline_bp = Blueprint("pipeline", __name__, url_prefix="/pipeline")
+
+
+def _save(folder: str, data: bytes) -> str:
+    """保存JPEG并返回访问路径"""
+    image_name = f"{uuid.uuid4()}.jpg"
+    with open(os.path.join(folder, image_name), "wb") as f:
+        f.write(data)
+    return f"/upload/{os.path.basename(os.path.normpath(folder))}/{image_name}"
+
+
+@pipeline_bp.route("/images", methods=["POST"])
+def pipeline_images():
+    """
+    去雾+检测一次完成，图像只解码一次，去雾结果直接在内存中送入检测
+
+    请求:
+    - JSON {"image_id": 已上传图片的ID}，或 multipart 的 image 字段 / 原始图像字节
+    查询参数:
+    - include_dehazed: 是否同时返回去雾后的图像（不含检测框），默认false
+    - save: 是否保存输出图像到去雾和检测目录，默认false
+
+    返回:
+    {
+        "code": 200,
+        "detections": [{"bbox", "confidence", "label"}],
+        "images": {"detected": base64 JPEG, "dehazed": base64 JPEG（可选）},
+        "file_paths": {"detected", "dehazed"}（save=true时）,
+        "stage_times": {"decode", "dehaze", "detect", "encode"},
+        "process_time": 总耗时
+    }
+    """
+    stage_times = {}
+    start = time.perf_counter()
+
+    image_id = request.json.get("image_id") if request.is_json else None
+    try:
+        if image_id:
+            _, image_path = find_upload_image(image_id)
+            if image_path is None:
+                return jsonify({"error": "Image not found"}), 404
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError("无法读取图像文件")
+        else:
+            data = request_image_bytes(request)
+            if not data:
+                return jsonify({"error": "No image provided"}), 400
+            image = decode_image(data)
+    except ValueError:
+        return jsonify({"error": "Invalid image data"}), 400
+    stage_times["decode"] = time.perf_counter() - start
+
+    try:
+        mark = time.perf_counter()
+        dehazed = get_dehaze_engine().dehaze_frames([image])[0]
+        stage_times["dehaze"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        detections = array_batcher.submit(dehazed).result()
+        stage_times["detect"] = time.perf_counter() - mark
+    except Exception as e:
+        logger.error(f"Pipeline failed: {str(e)}")
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+    mark = time.perf_counter()
+    include_dehazed = request_flag(request, "include_dehazed")
+    save = request_flag(request, "save")
+    images = {}
+    if include_dehazed or save:
+        images["dehazed"] = encode_jpeg(dehazed)
+    # 去雾图像编码完成后再原地绘制检测框
+    images["detected"] = encode_jpeg(draw_detections(dehazed, detections))
+    stage_times["encode"] = time.perf_counter() - mark
+
+    result = {
+        "code": 200,
+        "message": "Pipeline success",
+        "detections": detections,
+        "images": {
+            name: to_base64(data)
+            for name, data in images.items()
+            if name == "detected" or include_dehazed
+        },
+        "stage_times": stage_times,
+        "process_time": time.perf_counter() - start,
+    }
+    if save:
+        result["file_paths"] = {
+            "dehazed": _save(DEHAZE_FOLDER, images["dehazed"]),
+            "detected": _save(DETECT_FOLDER, images["detected"]),
+        }
+    return jsonify(result)
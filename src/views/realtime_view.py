@@ -1,15 +1,18 @@
 import os
-from flask import Response, Blueprint
+from flask import Response, Blueprint, jsonify
 from src.MultiModalVideoDetector import MultiModalVideoDetector
 from src.config import ROOT
+from src.stream_hub import stream_hub
 
 realtime_bp = Blueprint("realtime", __name__, url_prefix="/")
 
+# 当前共享流使用的检测器，用于查询延迟统计
+_realtime_detector = None
 
-@realtime_bp.route("/realtime", methods=["GET"])
-def video_feed():
-    """实时双模态视频流接口"""
 
+def _realtime_frames():
+    """创建检测器并逐帧产出 MJPEG 数据，由共享生产者线程调用"""
+    global _realtime_detector
     # IR视频参数
     ir_params = {
         "video_path": os.path.join(ROOT, "data", "output_ir.mp4"),
@@ -31,11 +34,35 @@ def video_feed():
         ir_params=ir_params,
         tr_params=tr_params,
         model_path=os.path.join(ROOT, "model", "yolo11n_merge_tr.pt"),  # YOLO模型路径
-        output_path="output_detection.mp4",
         conf_thres=0.6,
-        show_preview=True,
+        show_preview=False,
+        realtime=True,
     )
+    _realtime_detector = detector
+    return detector.gen()
+
 
+@realtime_bp.route("/realtime", methods=["GET"])
+def video_feed():
+    """实时双模态视频流接口
+
+    所有观看者共享同一个检测器：视频只打开一次、每帧只检测和编码一次，
+    编码后的帧通过环形缓冲区分发，网络慢的观看者会跳帧而不会拖慢检测。
+    检测器工作在实时模式，始终处理最新的一对帧，并按延迟预算调整推理分辨率。
+    """
+    stream = stream_hub.get("realtime", _realtime_frames)
     return Response(
-        detector.gen(), mimetype="multipart/x-mixed-replace; boundary=frame"
+        stream.subscribe(), mimetype="multipart/x-mixed-replace; boundary=frame"
+    )
+
+
+@realtime_bp.route("/realtime/stats", methods=["GET"])
+def stream_stats():
+    """实时视频流的观看者数、帧率、丢帧统计，以及检测器的端到端延迟和推理分辨率"""
+    detector = _realtime_detector
+    return jsonify(
+        {
+            "streams": stream_hub.stats(),
+            "latency": detector.latency_stats() if detector is not None else None,
+        }
     )
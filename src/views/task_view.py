@@ -1,5 +1,10 @@
-from flask import Blueprint, jsonify
-from src.task_manager import task_manager, TaskStatus
+import json
+import time
+
+from flask import Blueprint, Response, jsonify, request
+from src.detection_log import read_detections
+from src.task_manager import task_manager, TaskStatus, FINISHED_STATUSES
+from src.scheduler import job_scheduler
 from src.config import get_logger
 
 
@@ -19,9 +24,13 @@ def get_task_status(task_id):
     Returns:
         JSON Response:
         {
-            "status": "pending|processing|completed|failed",
+            "status": "pending|queued|processing|completed|failed|cancelled",
             "result": {...} | null,  # 当任务完成时返回结果
             "error": "错误信息" | null,  # 当任务失败时返回错误信息
+            "queue_position": 1,  # 仅在排队时返回，从1开始
+            "progress": {  # 视频类任务的处理进度
+                "frames_done", "total_frames", "percent", "fps", "eta_seconds"
+            } | null,
         }
     """
     status = task_manager.get_task_status(task_id)
@@ -33,27 +42,120 @@ def get_task_status(task_id):
         "status": status["status"].value,  # 将枚举转换为字符串
         "result": status.get("result"),
         "error": status.get("error"),
+        "progress": status.get("progress"),
     }
+    if status["status"] == TaskStatus.QUEUED:
+        response_data["queue_position"] = job_scheduler.queue_position(task_id)
 
     return jsonify(response_data)
 
 
+@task_bp.route("/events/<task_id>", methods=["GET"])
+def task_events(task_id):
+    """
+    以Server-Sent Events推送任务状态和进度
+
+    状态或进度变化时推送一条事件，任务结束后推送最终状态并关闭连接。
+    事件数据格式与 /task/status 相同。
+    """
+    if task_manager.store.get(task_id) is None:
+        return jsonify({"error": "Task not found"}), 404
+
+    def generate():
+        last_payload = None
+        last_sent = time.monotonic()
+        while True:
+            task = task_manager.store.get(task_id)
+            if task is None:
+                yield "event: error\ndata: {\"error\": \"Task not found\"}\n\n"
+                return
+
+            data = {
+                "status": task["status"].value,
+                "result": task.get("result"),
+                "error": task.get("error"),
+                "progress": task.get("progress"),
+            }
+            if task["status"] == TaskStatus.QUEUED:
+                data["queue_position"] = job_scheduler.queue_position(task_id)
+            payload = json.dumps(data, ensure_ascii=False)
+
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= 15:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            if task["status"] in FINISHED_STATUSES:
+                return
+            time.sleep(0.5)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@task_bp.route("/cancel/<task_id>", methods=["POST"])
+def cancel_task(task_id):
+    """
+    取消排队中或执行中的任务
+
+    执行中的任务在下一次检查点停止，已结束的任务无法取消。
+    """
+    status = task_manager.get_task_status(task_id)
+    if status is None:
+        return jsonify({"error": "Task not found"}), 404
+
+    if not job_scheduler.cancel(task_id):
+        return jsonify(
+            {"error": "Task cannot be cancelled", "status": status["status"].value}
+        ), 400
+
+    return jsonify({"message": "Task cancelled", "task_id": task_id})
+
+
 @task_bp.route("/list", methods=["GET"])
 def list_tasks():
-    """获取所有任务列表"""
+    """
+    分页获取任务列表
+
+    请求参数:
+    - page: 页码，从1开始，默认1
+    - page_size: 每页数量，默认50，最大500
+    - status: 按任务状态过滤（可选）
+    """
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        page_size = min(500, max(1, int(request.args.get("page_size", 50))))
+        status = request.args.get("status")
+        status = TaskStatus(status) if status else None
+    except ValueError:
+        return jsonify({"error": "Invalid pagination or status parameter"}), 400
+
+    items, total = task_manager.list_tasks(
+        offset=(page - 1) * page_size, limit=page_size, status=status
+    )
     tasks = []
-    for task_id, task_info in task_manager.tasks.items():
+    for task_id, task_info in items:
         task_data = {
             "task_id": task_id,
             "status": task_info["status"].value,
             "start_time": task_info.get("start_time"),
+            "end_time": task_info.get("end_time"),
             "has_result": task_info.get("result") is not None,
             "has_error": task_info.get("error") is not None,
         }
         tasks.append(task_data)
 
-    logger.info(f"Current tasks: {len(tasks)}")
-    return jsonify({"tasks": tasks})
+    logger.info(f"Current tasks: {total}")
+    return jsonify(
+        {"tasks": tasks, "total": total, "page": page, "page_size": page_size}
+    )
 
 
 @task_bp.route("/result/<task_id>", methods=["GET"])
@@ -102,3 +204,78 @@ def get_task_result(task_id):
 
     # 返回处理结果
     return jsonify({"result": task_info["result"]})
+
+
+@task_bp.route("/result/<task_id>/detections", methods=["GET"])
+def get_task_detections(task_id):
+    """
+    按范围读取视频检测任务的逐帧检测结果，只读取范围内的数据
+
+    请求参数:
+    - from: 范围起点（含），默认从头开始
+    - to: 范围终点（含），默认到结尾
+    - unit: "s" 按时间戳（秒，默认）或 "frame" 按帧序号
+    - limit: 最多返回的帧数，默认1000，最大10000
+
+    Returns:
+        JSON Response:
+        {
+            "task_id": "...",
+            "format": "jsonl|columnar",
+            "frames": [{"frame", "ts", "keyframe", "detections": [{"bbox", "confidence", "label"}]}],
+            "count": 帧数,
+            "next_from": 下一页的起点 | null
+        }
+    """
+    task_info = task_manager.get_task_status(task_id)
+    if task_info is None:
+        return jsonify({"error": "Task not found"}), 404
+    if task_info["status"] != TaskStatus.COMPLETED:
+        return jsonify(
+            {
+                "error": "Task is not completed yet",
+                "status": task_info["status"].value,
+            }
+        ), 400
+
+    stats = (task_info.get("result") or {}).get("stats") or {}
+    path = stats.get("detections_path")
+    if not path:
+        return jsonify({"error": "Task has no detection output"}), 404
+
+    try:
+        start, end = (
+            float(request.args[name]) if request.args.get(name) else None
+            for name in ("from", "to")
+        )
+        limit = min(10000, max(1, int(request.args.get("limit", 1000))))
+    except ValueError:
+        return jsonify({"error": "Invalid range parameter"}), 400
+    unit = request.args.get("unit", "s")
+    if unit not in ("s", "frame"):
+        return jsonify({"error": "Invalid unit"}), 400
+
+    try:
+        # 多读一帧用于判断是否还有下一页
+        frames = read_detections(
+            path, stats.get("detections_format", "jsonl"), start, end, unit, limit + 1
+        )
+    except FileNotFoundError:
+        return jsonify({"error": "Detection output not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    next_from = None
+    if len(frames) > limit:
+        next_from = frames[limit]["frame" if unit == "frame" else "ts"]
+        frames = frames[:limit]
+
+    return jsonify(
+        {
+            "task_id": task_id,
+            "format": stats.get("detections_format", "jsonl"),
+            "frames": frames,
+            "count": len(frames),
+            "next_from": next_from,
+        }
+    )
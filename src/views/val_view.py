@@ -3,13 +3,14 @@ import zipfile
 import uuid
 import yaml
 import shutil
-import threading
 import time
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from src.task_manager import task_manager, TaskStatus
+from src.scheduler import job_scheduler, JobPriority, QueueFullError
+from src.process_pool import execution_backend, validate_job
 from src.config import get_logger, VAL_FOLDER, UPLOAD_FOLDER, get_model_path
-from ultralytics import YOLO
+from src.model_registry import model_registry
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import (
@@ -157,7 +158,14 @@ def process_validation(task_id, zip_path, model_path):
         zip_path: ZIP文件路径
         model_path: 模型路径
     """
+    temp_extract_path = os.path.join(UPLOAD_FOLDER, "val", f"temp_{task_id}")
     try:
+        # 更新任务状态为处理中
+        task_manager.update_task(
+            task_id=task_id,
+            status=TaskStatus.PROCESSING,
+        )
+
         # 创建任务目录结构
         task_dir = os.path.join(VAL_FOLDER, task_id)
         train_dir = os.path.join(task_dir, "train")
@@ -168,7 +176,6 @@ def process_validation(task_id, zip_path, model_path):
         os.makedirs(os.path.join(val_dir, "labels"), exist_ok=True)
 
         # 解压文件到临时目录
-        temp_extract_path = os.path.join(UPLOAD_FOLDER, "val", f"temp_{task_id}")
         os.makedirs(temp_extract_path, exist_ok=True)
 
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
@@ -187,7 +194,9 @@ def process_validation(task_id, zip_path, model_path):
             )
 
             # 使用YOLO模型进行验证
-            model_validation_result = validate_with_model(model_path, task_dir)
+            model_validation_result = execution_backend.run(
+                validate_job, model_path, task_dir
+            )
             
             # 生成验证报告
             generate_validation_report(
@@ -257,13 +266,15 @@ def upload_val_dataset():
     if not file.filename.endswith(".zip"):
         return jsonify({"error": "只支持ZIP格式的文件"}), 400
 
+    if job_scheduler.is_full():
+        return jsonify({"error": "任务队列已满，请稍后重试"}), 429, {"Retry-After": "10"}
+
     # 获取模型名称（如果有）
     model_name = request.form.get("model_name")
     model_path = get_model_path(model_name)
 
     # 生成任务ID
     task_id = str(uuid.uuid4())
-    task_manager.create_task(task_id)
 
     # 保存ZIP文件
     zip_filename = secure_filename(file.filename)
@@ -271,19 +282,17 @@ def upload_val_dataset():
     os.makedirs(os.path.dirname(zip_path), exist_ok=True)
     file.save(zip_path)
 
-    # 更新任务状态为处理中
-    task_manager.update_task(
-        task_id=task_id,
-        status=TaskStatus.PROCESSING,
-    )
-
-    # 创建新线程处理验证任务
-    thread = threading.Thread(
-        target=process_validation,
-        args=(task_id, zip_path, model_path),
-    )
-    thread.daemon = True  # 设置为守护线程，这样主程序退出时线程会自动结束
-    thread.start()
+    # 提交验证任务，批量验证的优先级低于视频检测
+    try:
+        job_scheduler.submit(
+            task_id,
+            process_validation,
+            args=(task_id, zip_path, model_path),
+            priority=JobPriority.BULK,
+        )
+    except QueueFullError:
+        os.remove(zip_path)
+        return jsonify({"error": "任务队列已满，请稍后重试"}), 429, {"Retry-After": "10"}
 
     return jsonify({"task_id": task_id, "message": "数据集上传成功，正在验证"})
 
@@ -451,8 +460,8 @@ def validate_with_model(model_path, task_dir):
     }
 
     try:
-        # 加载YOLO模型
-        model = YOLO(model_path)
+        # 使用独立的模型实例验证，不占用推理请求共享的模型
+        model = model_registry.load_private(model_path)
 
         # 记录开始时间
         start_time = time.time()